@@ -1,6 +1,8 @@
 import logging
 import random
 
+from exact import BitmaskGame
+
 logger = logging.Logger(__name__)
 
 
@@ -41,7 +43,7 @@ def research():
         "bc": 30,
         "abc": 37,
     }
-    shapley_values = {"a": 6.5, "b": 11.5, "c": 19}
+    shapley_values = BitmaskGame.from_dict(map_subset_to_cost, players).shapley_values()
     perm_count = 0
     acc_sum = {p: 0 for p in players}
     # UNCOMMENT SEED TO REPRODUCE OUTCOME
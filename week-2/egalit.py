@@ -7,10 +7,26 @@ Date: 11-25
 import cvxpy as cp
 from numpy.typing import ArrayLike
 import numpy as np
-from itertools import combinations
+from scipy import sparse
+from scipy.optimize import linprog
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from time import perf_counter
+from typing import Iterable, Optional
 
+# scipy's linprog status code -> the matching cvxpy status
+LINPROG_STATUS = {
+    0: cp.OPTIMAL,
+    1: cp.USER_LIMIT,
+    2: cp.INFEASIBLE,
+    3: cp.UNBOUNDED,
+    4: cp.SOLVER_ERROR,
+}
 
-def egalitarian(valuation: ArrayLike, leximin: bool = False) -> np.ndarray:
+
+def egalitarian(
+    valuation: ArrayLike | sparse.sparray, leximin: bool = False, backend: str = "cvxpy"
+) -> np.ndarray | sparse.csr_array:
     """
     Finds an allocation that maxmimize the minimum value of agents given allocations.
     The leximin variant maximizes also all of the other minimum values.
@@ -31,13 +47,39 @@ def egalitarian(valuation: ArrayLike, leximin: bool = False) -> np.ndarray:
     >>> np.allclose(egalitarian(val, leximin=True), expected)
     True
 
+    The same LPs solved directly by HiGHS:
+    >>> np.allclose(egalitarian(val, leximin=True, backend="highs"), expected)
+    True
+
+    Sparse valuations get variables only for their nonzero entries, and a sparse result:
+    >>> np.allclose(egalitarian(sparse.csr_array(val), leximin=True).toarray(), expected)
+    True
+
     Args:
         valuation (ArrayLike): Evaluation matrix. valuation[i, j] = p -> agent i values all of resource j as p.
+            May be a scipy.sparse array.
         leximin (bool, optional): Use leximin variation of the algorithm. Defaults to False.
+        backend (str, optional): "cvxpy", or "highs" to skip cvxpy and pass sparse constraint
+            matrices to `scipy.optimize.linprog`. Defaults to "cvxpy".
 
     Returns:
         np.ndarray: A matrix such that [i, j] entry means agent i receives [i, j] portion of resource j.
+            A `sparse.csr_array` for sparse valuations.
     """
+    final_allocation, _ = _solve_egalitarian(valuation, leximin, backend)
+    return final_allocation
+
+
+def _solve_egalitarian(
+    valuation: ArrayLike, leximin: bool, backend: str = "cvxpy"
+) -> tuple[Optional[np.ndarray], str]:
+    """Solves `egalitarian` and returns the solver status of the last LP as well."""
+    if backend not in ("cvxpy", "highs"):
+        raise ValueError(f"Unknown backend {backend!r}, expected 'cvxpy' or 'highs'.")
+    if sparse.issparse(valuation):
+        return _egalitarian_sparse(valuation, leximin, backend)
+    if backend == "highs":
+        return _egalitarian_highs(valuation, leximin)
     valuation = np.asarray(valuation)  # convertion needed for cvxpy compatability
     n, m = valuation.shape
     # matrix[i, j] = x -> means agent i gets x portion of resource j
@@ -61,30 +103,325 @@ def egalitarian(valuation: ArrayLike, leximin: bool = False) -> np.ndarray:
     )
 
     problem.solve()
+    status = problem.status
 
     if leximin:
-        utility_sums = utilities
-        for subset_size in range(2, n + 1):
-            # Add previous min_utility as constant
-            for u_sum in utility_sums:
-                base_constraints.append(u_sum >= min_utility.value)
-
-            # Construt new utility sums combinations for this level
-            utility_sums = [
-                cp.sum(cp.hstack(combo))  # more efficient summing in cvxpy
-                for combo in combinations(utilities, subset_size)
+        status = _leximin_rounds(utilities, base_constraints)
+
+    if allocation_matrix.value is None:
+        return None, status
+    final_allocation = allocation_matrix.value.round(2)
+    return final_allocation, status
+
+
+def egalitarian_batch(
+    valuations: Iterable[ArrayLike],
+    leximin: bool = False,
+    backend: str = "cvxpy",
+    max_workers: Optional[int] = None,
+    chunksize: int = 16,
+) -> tuple[np.ndarray, list[str]]:
+    """
+    Solves `egalitarian` for many instances of the same shape over a process pool.
+
+    Usage example:
+    >>> vals = np.array([[[81, 19, 1], [70, 1, 29]], [[1, 0, 0], [0, 1, 1]]])
+    >>> allocations, statuses = egalitarian_batch(vals, max_workers=2)
+    >>> allocations.shape, statuses
+    ((2, 2, 3), ['optimal', 'optimal'])
+    >>> np.allclose(allocations[0], [[0.53, 1, 0], [0.47, 0, 1]])
+    True
+    >>> instances = [sparse.csr_array([[0, 100], [50, 0]]), sparse.csr_array([[1, 0], [0, 1]])]
+    >>> allocations, statuses = egalitarian_batch(instances, backend="highs", max_workers=1)
+    >>> allocations.tolist(), statuses
+    ([[[0.0, 1.0], [1.0, 0.0]], [[1.0, 0.0], [0.0, 1.0]]], ['optimal', 'optimal'])
+
+    Args:
+        valuations (Iterable[ArrayLike]): A (k, n, m) array or an iterator of (n, m)
+            valuations, which may be scipy.sparse arrays.
+        leximin (bool, optional): Use leximin variation of the algorithm. Defaults to False.
+        backend (str, optional): "cvxpy" or "highs", as in `egalitarian`. Defaults to "cvxpy".
+        max_workers (Optional[int], optional): Number of processes. Defaults to the number of CPUs.
+        chunksize (int, optional): Instances sent to a worker at once. Defaults to 16.
+
+    Returns:
+        tuple[np.ndarray, list[str]]: The (k, n, m) allocations in input order, NaN where the
+            solve failed, and the solver status of every instance.
+    """
+    solve = partial(_solve_egalitarian, leximin=leximin, backend=backend)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(solve, valuations, chunksize=chunksize))
+    return _stack_results(results)
+
+
+def _stack_results(results: list[tuple[Optional[np.ndarray], str]]) -> tuple[np.ndarray, list[str]]:
+    shape = next((alloc.shape for alloc, _ in results if alloc is not None), (0, 0))
+    stacked = np.full((len(results), *shape), np.nan)
+    for k, (alloc, _) in enumerate(results):
+        if alloc is not None:
+            # Sparse instances give sparse allocations, stacked densely with the others
+            stacked[k] = alloc.toarray() if sparse.issparse(alloc) else alloc
+    return stacked, [status for _, status in results]
+
+
+def _leximin_rounds(
+    utilities: cp.Expression,
+    base_constraints: list,
+    tol: float = 1e-6,
+) -> str:
+    """
+    Lexicographically maximizes the sorted utilities vector by saturating agents.
+
+    Each round maximizes the minimum utility of the agents that are still free, while
+    keeping the already saturated agents at their values. An agent whose constraint
+    has a positive dual value cannot be improved without hurting another agent at the
+    current minimum, so it is fixed at that level. Every round fixes at least one agent,
+    hence at most n rounds of an LP with n * m variables are solved.
+
+    Args:
+        utilities (cp.Expression): Utility expression of every agent. The variables it
+            depends on hold the leximin solution when the function returns.
+        base_constraints (list): The feasibility constraints of the allocation.
+        tol (float, optional): Slack for fixing saturated levels. Defaults to 1e-6.
+
+    Returns:
+        str: The solver status of the last round.
+    """
+    n = utilities.shape[0]
+    free = np.ones(n, dtype=bool)
+    saturated_levels = np.zeros(n)
+    while free.any():
+        min_utility = cp.Variable()
+        free_idx, fixed_idx = np.flatnonzero(free), np.flatnonzero(~free)
+        level_constraint = utilities[free_idx] >= min_utility
+        constraints = base_constraints + [level_constraint]
+        if fixed_idx.size:
+            levels = saturated_levels[fixed_idx]
+            constraints.append(utilities[fixed_idx] >= levels - tol * np.maximum(1, np.abs(levels)))
+        problem = cp.Problem(cp.Maximize(min_utility), constraints)
+        problem.solve()
+        if level_constraint.dual_value is None:
+            return problem.status
+        duals = np.atleast_1d(level_constraint.dual_value)
+        # The duals sum to 1, so at least one free agent is above the threshold
+        newly_saturated = free_idx[duals > min(tol, duals.max() / 2)]
+        saturated_levels[newly_saturated] = min_utility.value
+        free[newly_saturated] = False
+    return problem.status
+
+
+def _support_matrices(
+    rows: np.ndarray, cols: np.ndarray, values: np.ndarray, n: int, m: int
+) -> tuple[sparse.csr_array, sparse.csr_array]:
+    """
+    Constraint matrices over the allocation variables of the given (agent, resource) pairs.
+
+    Returns:
+        tuple[sparse.csr_array, sparse.csr_array]: The (n, k) matrix mapping the k variables
+            to the agents utilities, and the (m, k) matrix summing every resource's portions.
+    """
+    k = rows.size
+    utilities_matrix = sparse.csr_array((values, (rows, np.arange(k))), shape=(n, k))
+    sums_matrix = sparse.csr_array((np.ones(k), (cols, np.arange(k))), shape=(m, k))
+    return utilities_matrix, sums_matrix
+
+
+def _egalitarian_highs(valuation: ArrayLike, leximin: bool) -> tuple[Optional[np.ndarray], str]:
+    """Solves `egalitarian` with the constraint matrices built directly for HiGHS."""
+    valuation = np.asarray(valuation, dtype=float)
+    n, m = valuation.shape
+    rows, cols = np.divmod(np.arange(n * m), m)  # the allocation flattened by rows
+    utilities_matrix, sums_matrix = _support_matrices(rows, cols, valuation.ravel(), n, m)
+    portions, status = _max_min_highs(utilities_matrix, sums_matrix, leximin)
+    if portions is None:
+        return None, status
+    return portions.reshape(n, m).round(2), status
+
+
+def _max_min_highs(
+    utilities_matrix: sparse.csr_array,
+    sums_matrix: sparse.csr_array,
+    leximin: bool,
+    tol: float = 1e-6,
+) -> tuple[Optional[np.ndarray], str]:
+    """
+    Max-min LP over the allocation variables of `_support_matrices`, solved by HiGHS.
+
+    The LP variables are the allocation variables followed by the minimum utility. Leximin
+    uses the same saturation rounds as `_leximin_rounds`, reading the duals from the
+    marginals of the inequality constraints.
+    """
+    (n, k), m = utilities_matrix.shape, sums_matrix.shape[0]
+    # Every resource is allocated entirely
+    a_eq = sparse.hstack([sums_matrix, sparse.csr_array((m, 1))])
+    bounds = [(0, 1)] * k + [(None, None)]
+    objective = np.zeros(k + 1)
+    objective[-1] = -1  # maximize the minimum utility
+
+    free = np.ones(n, dtype=bool)
+    saturated_levels = np.zeros(n)
+    while True:
+        free_idx, fixed_idx = np.flatnonzero(free), np.flatnonzero(~free)
+        # min_utility - u_i <= 0 for free agents, -u_i <= -level_i for saturated agents
+        a_ub = sparse.vstack(
+            [
+                sparse.hstack([-utilities_matrix[free_idx], sparse.csr_array(np.ones((free_idx.size, 1)))]),
+                sparse.hstack([-utilities_matrix[fixed_idx], sparse.csr_array((fixed_idx.size, 1))]),
             ]
-            # Update to the next min_utility
-            min_utility = cp.Variable()
-            leximin_constraints = [u_sum >= min_utility for u_sum in utility_sums]
-            problem = cp.Problem(
-                objective=cp.Maximize(min_utility),
-                constraints=base_constraints + leximin_constraints,
+        )
+        levels = saturated_levels[fixed_idx]
+        b_ub = np.concatenate([np.zeros(free_idx.size), tol * np.maximum(1, np.abs(levels)) - levels])
+        res = linprog(objective, a_ub, b_ub, a_eq, np.ones(m), bounds, method="highs")
+        status = LINPROG_STATUS.get(res.status, cp.SOLVER_ERROR)
+        if res.status != 0:
+            return None, status
+        if not leximin:
+            break
+        duals = -res.ineqlin.marginals[: free_idx.size]
+        newly_saturated = free_idx[duals > min(tol, duals.max() / 2)]
+        saturated_levels[newly_saturated] = res.x[-1]
+        free[newly_saturated] = False
+        if not free.any():
+            break
+    return res.x[:-1], status
+
+
+def _egalitarian_sparse(
+    valuation: sparse.sparray, leximin: bool, backend: str
+) -> tuple[Optional[sparse.csr_array], str]:
+    """
+    Solves `egalitarian` with allocation variables only for the nonzero valuations.
+
+    Giving a portion of a resource to an agent that does not value it never helps the
+    minimum, so the optimum over this support is the same as the dense one. A resource
+    that nobody values still has to be allocated, so it gets a single variable for the
+    first agent.
+    """
+    valuation = sparse.coo_array(valuation, dtype=float)
+    valuation.sum_duplicates()
+    valuation.eliminate_zeros()
+    n, m = valuation.shape
+    unvalued = np.setdiff1d(np.arange(m), valuation.col)
+    rows = np.concatenate([valuation.row, np.zeros(unvalued.size, dtype=int)])
+    cols = np.concatenate([valuation.col, unvalued])
+    values = np.concatenate([valuation.data, np.zeros(unvalued.size)])
+    utilities_matrix, sums_matrix = _support_matrices(rows, cols, values, n, m)
+
+    if backend == "highs":
+        portions, status = _max_min_highs(utilities_matrix, sums_matrix, leximin)
+    else:
+        allocation = cp.Variable(rows.size)
+        min_utility = cp.Variable()
+        utilities = utilities_matrix @ allocation
+        base_constraints = [allocation >= 0, allocation <= 1, sums_matrix @ allocation == 1]
+        problem = cp.Problem(cp.Maximize(min_utility), base_constraints + [utilities >= min_utility])
+        problem.solve()
+        status = problem.status
+        if leximin:
+            status = _leximin_rounds(utilities, base_constraints)
+        portions = allocation.value
+    if portions is None:
+        return None, status
+    final_allocation = sparse.csr_array((portions.round(2), (rows, cols)), shape=(n, m))
+    final_allocation.eliminate_zeros()
+    return final_allocation, status
+
+
+class EgalitarianSolver:
+    """
+    The max-min egalitarian LP compiled once for a fixed number of agents and resources.
+
+    The valuations are a `cp.Parameter`, so cvxpy canonicalizes the problem on the first
+    solve only, and later solves only update the parameter and warm start the solver.
+
+    Usage example:
+    >>> solver = EgalitarianSolver(2, 3)
+    >>> np.allclose(solver.solve([[81, 19, 1], [70, 1, 29]]), [[0.53, 1, 0], [0.47, 0, 1]])
+    True
+    >>> solver.solve([[0, 100], [50, 0], [0, 0]])
+    Traceback (most recent call last):
+    ...
+    ValueError: Expected valuation of shape (2, 3), got (3, 2).
+    """
+
+    def __init__(self, n: int, m: int) -> None:
+        self.valuation = cp.Parameter(shape=(n, m))
+        self.allocation_matrix = cp.Variable(shape=(n, m))
+        min_utility = cp.Variable()
+        utilities = cp.multiply(self.valuation, self.allocation_matrix).sum(axis=1)
+        constraints = [
+            self.allocation_matrix >= 0,
+            self.allocation_matrix <= 1,
+            self.allocation_matrix.sum(axis=0) == 1,
+            utilities >= min_utility,
+        ]
+        self.problem = cp.Problem(cp.Maximize(min_utility), constraints)
+
+    def solve(self, valuation: ArrayLike) -> np.ndarray:
+        """
+        Solves the compiled problem for new valuations of the same shape.
+
+        Args:
+            valuation (ArrayLike): Evaluation matrix of the compiled shape.
+
+        Returns:
+            np.ndarray: The egalitarian allocation matrix, as returned by `egalitarian`.
+        """
+        valuation = np.asarray(valuation, dtype=float)
+        if valuation.shape != self.valuation.shape:
+            raise ValueError(
+                f"Expected valuation of shape {self.valuation.shape}, got {valuation.shape}."
             )
-            problem.solve()
+        self.valuation.value = valuation
+        self.problem.solve(warm_start=True)
+        return self.allocation_matrix.value.round(2)
 
-    final_allocation = allocation_matrix.value.round(2)
-    return final_allocation
+
+@lru_cache(maxsize=32)
+def compiled_egalitarian(n: int, m: int) -> EgalitarianSolver:
+    """Returns the cached compiled solver for the shape, keeping the 32 most recent shapes."""
+    return EgalitarianSolver(n, m)
+
+
+def egalitarian_cached(valuation: ArrayLike) -> np.ndarray:
+    """
+    Same as `egalitarian` without leximin, reusing a compiled problem per shape.
+
+    Usage example:
+    >>> val = [[81, 19, 1], [70, 1, 29]]
+    >>> np.allclose(egalitarian_cached(val), egalitarian(val))
+    True
+
+    Args:
+        valuation (ArrayLike): Evaluation matrix. valuation[i, j] = p -> agent i values all of resource j as p.
+
+    Returns:
+        np.ndarray: A matrix such that [i, j] entry means agent i receives [i, j] portion of resource j.
+    """
+    valuation = np.asarray(valuation)
+    return compiled_egalitarian(*valuation.shape).solve(valuation)
+
+
+def compare_setup_time(valuations: Iterable[ArrayLike]) -> dict:
+    """
+    Times `egalitarian` against `egalitarian_cached` on the same instances.
+
+    Args:
+        valuations (Iterable[ArrayLike]): Instances to solve with both functions.
+
+    Returns:
+        dict: Mean seconds per call of each function, and the fraction of time saved.
+    """
+    valuations = [np.asarray(v) for v in valuations]
+    start = perf_counter()
+    for v in valuations:
+        egalitarian(v)
+    plain = (perf_counter() - start) / len(valuations)
+    start = perf_counter()
+    for v in valuations:
+        egalitarian_cached(v)
+    cached = (perf_counter() - start) / len(valuations)
+    return {"egalitarian": plain, "cached": cached, "saved": 1 - cached / plain}
 
 
 def summary(alloc: np.ndarray) -> str:
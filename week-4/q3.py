@@ -1,63 +1,173 @@
+from math import comb
+from typing import Iterator, Optional
+
 import numpy as np
+from numpy.typing import ArrayLike
+
+
+def price(T: float, n: int, R: float, xj: ArrayLike) -> np.ndarray:
+    """The price of a room with share xj, when the cheapest room costs T - (T * n - R).
+
+    Works for any number of rooms: the prices of shares that sum up to 1 sum up to R.
+
+    >>> price(T=100, n=3, R=100, xj=np.array([0.2, 0.2, 0.6])).round(2).tolist()
+    [60.0, 60.0, -20.0]
+
+    Args:
+        T (float): The price of a room with share 0
+        n (int): Number of rooms
+        R (float): Total rent
+        xj (ArrayLike): The shares of the rooms, of any shape
+
+    Returns:
+        np.ndarray: The price of every share
+    """
+    return T - (T * n - R) * np.asarray(xj)
+
+
+def _compositions(total: int, parts: int) -> np.ndarray:
+    """All the ways to write total as an ordered sum of parts non negative integers, in
+    lexicographic order, as a (comb(total + parts - 1, parts - 1), parts) array."""
+    rows = np.zeros((1, 0), dtype=int)
+    remaining = np.array([total])
+    for _ in range(parts - 1):
+        counts = remaining + 1
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        values = np.arange(counts.sum()) - starts
+        rows = np.column_stack([np.repeat(rows, counts, axis=0), values])
+        remaining = np.repeat(remaining, counts) - values
+    return np.column_stack([rows, remaining])
+
+
+def simplex_grid(rooms: int, resolution: int, chunk_size: int = 100_000) -> Iterator[np.ndarray]:
+    """Streams the shares grid {x : sum(x) = 1, x >= 0, resolution * x integer} in chunks.
+
+    A prefix of the first shares is fixed until the remaining points fit in a chunk, which are
+    then generated at once, so the memory is O(chunk_size * rooms) for any grid size.
 
+    >>> chunks = list(simplex_grid(3, 5, chunk_size=8))
+    >>> [len(chunk) for chunk in chunks], sum(len(chunk) for chunk in chunks) == comb(7, 2)
+    ([6, 5, 7, 3], True)
+    >>> chunks[0][:3].tolist()
+    [[0.0, 0.0, 1.0], [0.0, 0.2, 0.8], [0.0, 0.4, 0.6]]
 
-def price(T, n, R, xj):
-    return T - (T * n - R) * xj
+    Args:
+        rooms (int): Number of rooms
+        resolution (int): Number of grid steps, 5 for a step of 0.2
+        chunk_size (int, optional): Maximal number of points in a chunk. Defaults to 100_000.
 
+    Yields:
+        np.ndarray: (k, rooms) shares, in lexicographic order
+    """
+    pending, pending_size = [], 0
 
-R = T = 100
-n = 3
+    def blocks(prefix: list[int], remaining: int) -> Iterator[np.ndarray]:
+        parts = rooms - len(prefix)
+        if comb(remaining + parts - 1, parts - 1) <= chunk_size or parts == 1:
+            block = _compositions(remaining, parts)
+            yield np.column_stack([np.tile(prefix, (len(block), 1)), block])
+            return
+        for first in range(remaining + 1):
+            yield from blocks(prefix + [first], remaining - first)
 
-avi, beni, gabi = range(3)
-martef, shena, salon = range(3)
-valuation = np.array(
-    [
-        [10, 20, 70],
-        [20, 45, 35],
-        [10, 45, 45],
-    ]
-)
+    for block in blocks([], resolution):
+        # Merge the small blocks of deep prefixes into full chunks
+        if pending_size + len(block) > chunk_size and pending:
+            yield np.concatenate(pending) / resolution
+            pending, pending_size = [], 0
+        pending.append(block)
+        pending_size += len(block)
+    if pending:
+        yield np.concatenate(pending) / resolution
 
 
-edges = [0, 0.2, 0.4, 0.6, 0.8, 1]
-prices = dict()
-for p in edges:
-    prices[p] = price(R=R, n=n, T=T, xj=p)
+def explore(
+    valuations: ArrayLike,
+    rent: float,
+    resolution: int,
+    top: Optional[float] = None,
+    chunk_size: int = 100_000,
+) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Prices every point of the shares grid and finds the preferred room of every player.
 
-print(prices)
+    Usage example:
+    >>> valuation = [[10, 20, 70], [20, 45, 35], [10, 45, 45]]
+    >>> shares, prices, preferred = next(explore(valuation, rent=100, resolution=5))
+    >>> shares[7].tolist(), prices[7].round(2).tolist(), preferred[7].tolist()
+    ([0.2, 0.2, 0.6], [60.0, 60.0, -20.0], [2, 2, 2])
 
-counter = 0
-for a in edges:
-    for b in edges:
-        if a + b <= 1:
-            counter += 1
-            share = np.array([a, b, round(1 - a - b, 2)])
+    Args:
+        valuations (ArrayLike): valuations[i][j] is the value of player i for room j
+        rent (float): Total rent
+        resolution (int): Number of grid steps, 5 for a step of 0.2
+        top (Optional[float], optional): The price of a room with share 0. Defaults to the rent.
+        chunk_size (int, optional): Maximal number of grid points in a chunk. Defaults to 100_000.
+
+    Yields:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The (k, rooms) shares, the (k, rooms) prices,
+            and the (k, players) preferred room of every player at every point.
+    """
+    valuations = np.asarray(valuations, dtype=float)
+    rooms = valuations.shape[1]
+    top = rent if top is None else top
+    for shares in simplex_grid(rooms, resolution, chunk_size):
+        prices = price(top, rooms, rent, shares)
+        # utilities[k, i, j]: the utility of player i from room j at grid point k
+        utilities = valuations[None, :, :] - prices[:, None, :]
+        yield shares, prices, np.argmax(utilities, axis=2)
+
+
+if __name__ == "__main__":
+    R = T = 100
+    n = 3
+
+    avi, beni, gabi = range(3)
+    martef, shena, salon = range(3)
+    valuation = np.array(
+        [
+            [10, 20, 70],
+            [20, 45, 35],
+            [10, 45, 45],
+        ]
+    )
+
+    edges = [0, 0.2, 0.4, 0.6, 0.8, 1]
+    prices = dict()
+    for p in edges:
+        prices[p] = price(R=R, n=n, T=T, xj=p)
+
+    print(prices)
+
+    counter = 0
+    for shares, timhurim, preferred in explore(valuation, rent=R, resolution=5, top=T):
+        for share, timhur, m in zip(shares, timhurim, preferred):
             print(share)
-            timhur = tuple(prices[x] for x in share)
-            timhur = np.array(timhur)
             print(timhur)
             vmt = valuation - timhur
             print(vmt)
-            m = np.argmax(vmt, axis=1)
             print(m)
             print()
+        counter += len(shares)
+    print("Total:", counter)
 
-print("Total:", counter)
+    print(6 + 5 + 4 + 3 + 2 + 1)
 
-
-print(6 + 5 + 4 + 3 + 2 + 1)
-
-t = np.array(
+    t = np.array(
         [
             [0.4, 0.4, 0.2],
             [0.4, 0.2, 0.4],
             [0.6, 0.2, 0.2],
         ]
     ).mean(axis=0)
-print(valuation - price(T, n, R, t))
-print(np.argmax(valuation - price(T, n, R, xj=t), axis=1)
-)
-t = np.array([0.4, 0.3, .3])
-print(valuation - price(T, n, R, t))
-t = (np.array([0.5, 0.3, .2]) + np.array([.4, .3, .3])) / 2
-print(valuation - price(T, n, R, t))
+    print(valuation - price(T, n, R, t))
+    print(np.argmax(valuation - price(T, n, R, xj=t), axis=1))
+    t = np.array([0.4, 0.3, 0.3])
+    print(valuation - price(T, n, R, t))
+    t = (np.array([0.5, 0.3, 0.2]) + np.array([0.4, 0.3, 0.3])) / 2
+    print(valuation - price(T, n, R, t))
+
+    # A room division where every player prefers a different room
+    for shares, _, preferred in explore(valuation, rent=R, resolution=20, top=T):
+        distinct = np.sort(preferred, axis=1) == np.arange(3)
+        for share in shares[distinct.all(axis=1)]:
+            print("Envy free shares:", share)
@@ -1,6 +1,7 @@
 import logging
-from itertools import combinations
-import networkx as nx
+import numpy as np
+
+from q6.assignment import allocate_rooms
 
 # logging.basicConfig(level=logging.DEBUG)
 
@@ -13,60 +14,81 @@ def summary(valuations: list[list[float]], rooms_alloc: dict, pricing: dict) ->
         sentences.append(f"Player {player} gets room {room} with value {val}, and pays {price}")
     return "\n".join(sentences)
 
-def allocate_rooms(valuations: list[list[float]]) -> dict:
-    g = nx.Graph()
-    n, m = len(valuations), len(valuations[0])
-    for i in range(n):
-        for j in range(m):
-            g.add_edge(
-                f"player {i}", f"room {j}", weight=valuations[i][j], player=i, room=j
-            )
-    # Find the maximum allocation
-    allocation_edges = nx.max_weight_matching(g)
-    logging.debug("Max weighted matching: %s", allocation_edges)
-    # Extract the allocation
-    rooms_allocation = {}
-    for u, v in allocation_edges:
-        e = g[u][v]
-        rooms_allocation[e["player"]] = e["room"]
-    return rooms_allocation
+def envy_free_prices(valuations: list[list[float]], rooms_allocation: dict, rent: float) -> np.ndarray:
+    """Prices of the allocated rooms by the heaviest paths in the envy graph.
+
+    envy[i, j] is how much player i envies player j. The grant of a player is the weight of
+    the heaviest envy path that starts at it, computed for all the players together by
+    Bellman-Ford relaxations towards a super-sink. Each relaxation is one O(n^2) vectorized
+    step, and at most n of them are needed.
+
+    Usage example:
+    >>> envy_free_prices([[150, 0], [140, 10]], {0: 0, 1: 1}, rent=130).tolist()
+    [130.0, 0.0]
+
+    Args:
+        valuations (list[list[float]]): The players valuations of the rooms
+        rooms_allocation (dict): The room of every player, with no positive envy cycle
+        rent (float): Total rent that needs to be paid
+
+    Returns:
+        np.ndarray: The price every player pays
+    """
+    valuations = np.asarray(valuations)
+    num_players = len(valuations)
+    rooms = np.array([rooms_allocation[player] for player in range(num_players)])
+    own_values = valuations[np.arange(num_players), rooms]
+    envy = valuations[:, rooms] - own_values[:, None]
+    logging.debug("envy matrix: %s", envy)
+    # grants[i] = max(0, max_j envy[i, j] + grants[j]), successors[i] is the j of the maximum.
+    # Updating a successor only on a strict improvement keeps the successors acyclic.
+    continuations = envy.astype(float)
+    np.fill_diagonal(continuations, -np.inf)
+    grants = np.zeros(num_players)
+    successors = np.arange(num_players)
+    for _ in range(num_players):
+        candidates = continuations + grants
+        best = np.argmax(candidates, axis=1)
+        improved = candidates[np.arange(num_players), best] > grants
+        if not improved.any():
+            break
+        successors[improved] = best[improved]
+        grants[improved] = candidates[improved, best[improved]]
+    else:
+        raise ValueError("The envy graph of the allocation has a positive cycle.")
+    # Sum every heaviest path again from its start, in the same order as a path search
+    path_sums = np.zeros_like(grants)
+    current = np.arange(num_players)
+    for _ in range(num_players):
+        following = successors[current]
+        if np.array_equal(following, current):
+            break
+        path_sums += envy[current, following]
+        current = following
+    grants = path_sums
+    logging.debug("Heaviest envy paths total weights: %s.", grants)
+    total_grants = np.cumsum(grants)[-1]  # sequential, like adding the grants one by one
+    price_for_all = (total_grants + rent) / num_players
+    return price_for_all - grants
+
+def envy_free_room_allocation(valuations: list[list[float]], rent: float) -> None:
+    """Allocates rooms with maximum total value and prices them by `envy_free_prices`.
 
-def envy_free_room_allocation(valuations: list[list[float]], rent: float) -> str:
+    Usage example:
+    >>> envy_free_room_allocation([[150, 0], [140, 10]], rent=130)
+    Player 0 gets room 0 with value 150, and pays 130.0
+    Player 1 gets room 1 with value 10, and pays 0.0
+    """
     # 1. Rooms allocation
     rooms_allocation = allocate_rooms(valuations)
     logging.debug("Allocation dictionary: %s", rooms_allocation)
-    
+
     # Pricing
-    # Build the envy-graph
-    envy_graph = nx.DiGraph()
-    num_players = len(valuations)
-    for i, j in combinations(range(num_players), 2):
-        xi, xj = rooms_allocation[i], rooms_allocation[j]
-        vi_xj, vi_xi = valuations[i][xj], valuations[i][xi]
-        vj_xi, vj_xj = valuations[j][xi], valuations[j][xj]
-        i_envy, j_envy = vi_xj - vi_xi, vj_xi - vj_xj
-        envy_graph.add_edge(i, j, envy=i_envy)
-        envy_graph.add_edge(j, i, envy=j_envy)
-    logging.debug("envy graph: %s", envy_graph.edges(data=True))
-    # For each node find the heaviest path
-    lengths = nx.all_pairs_bellman_ford_path_length(
-        envy_graph, weight=lambda u, v, data: -data["envy"]
-    )
-    pricing = {}
-    total_grants = 0
-    for player, dist in lengths:
-        grant = max(-x for x in dist.values())
-        logging.debug("for player %s the dist is %s", player, dist)
-        logging.debug("For player %s the heaviest envy path total weight is %s.", player, grant)
-        # player gets a "grant"
-        pricing[player] = -grant
-        total_grants += grant
-    price_for_all = (total_grants + rent) / num_players
-    for player in pricing:
-        pricing[player] += price_for_all
+    prices = envy_free_prices(valuations, rooms_allocation, rent)
+    pricing = dict(enumerate(prices.tolist()))
     logging.debug("Final pricing: %s.", pricing)
     print(summary(valuations, rooms_allocation, pricing))
-    
+
 if __name__ == "__main__":
     v = [[150, 0], [140, 10]]
     envy_free_room_allocation(valuations=v, rent=130)
@@ -0,0 +1,41 @@
+import numpy as np
+from numpy.typing import ArrayLike
+from scipy.optimize import linear_sum_assignment
+
+
+def assign_rooms(valuations: ArrayLike) -> np.ndarray:
+    """Finds the rooms assignment with maximum total value, in O(n^3) time.
+
+    The number of players and rooms may differ, in that case only min(players, rooms)
+    players get a room.
+
+    Usage example:
+    >>> assign_rooms([[150, 0], [140, 10]]).tolist()
+    [0, 1]
+    >>> assign_rooms([[1, 5, 2], [4, 6, 0]]).tolist()
+    [1, 0]
+    >>> assign_rooms([[1, 5], [4, 6], [9, 9]]).tolist()
+    [-1, 1, 0]
+
+    Args:
+        valuations (ArrayLike): valuations[i][j] is the value of player i for room j
+
+    Returns:
+        np.ndarray: The room of every player, -1 for players without a room
+    """
+    valuations = np.asarray(valuations, dtype=float)
+    players, rooms = linear_sum_assignment(valuations, maximize=True)
+    assignment = np.full(valuations.shape[0], -1)
+    assignment[players] = rooms
+    return assignment
+
+
+def allocate_rooms(valuations: list[list[float]]) -> dict:
+    """`assign_rooms` as a dictionary from player to room, skipping players without a room.
+
+    >>> allocate_rooms([[150, 0], [140, 10]])
+    {0: 0, 1: 1}
+    """
+    return {
+        player: room.item() for player, room in enumerate(assign_rooms(valuations)) if room >= 0
+    }
@@ -0,0 +1,63 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+from typing import Iterable
+from numpy.typing import ArrayLike
+
+from assignment import assign_rooms
+from pricing import MODES, envy_free_prices
+
+
+def _solve_instance(valuations: ArrayLike, rent: float, variant: str, backend: str) -> tuple:
+    rooms = assign_rooms(valuations)
+    rooms_allocation = dict(enumerate(rooms.tolist()))
+    prices, status = envy_free_prices(valuations, rooms_allocation, rent, variant, backend)
+    return rooms, prices, status
+
+
+def envy_free_prices_batch(
+    valuations: Iterable[ArrayLike],
+    rent: float | Iterable[float],
+    variant: str = "free",
+    backend: str = "cvxpy",
+    max_workers: int | None = None,
+    chunksize: int = 16,
+) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    """Allocates rooms and prices them for many instances over a process pool.
+
+    Usage example:
+    >>> vals = np.array([[[150, 10], [140, 10]], [[150, 10], [140, 10]]])
+    >>> rooms, prices, statuses = envy_free_prices_batch(vals, [100, 130], "nonnegative")
+    >>> rooms.tolist(), statuses
+    ([[0, 1], [0, 1]], ['infeasible', 'optimal'])
+    >>> bool(np.isnan(prices[0]).all()), np.allclose(prices[1], [130, 0])
+    (True, True)
+
+    Args:
+        valuations (Iterable[ArrayLike]): A (k, n, n) array or an iterator of (n, n) valuations
+        rent (float | Iterable[float]): Total rent of all instances, or of every instance
+        variant (str, optional): "free" (q6a), "nonnegative" (q6b) or "maxmin" (q6c), the pricing
+            modes of `pricing.envy_free_prices`. Defaults to "free".
+        backend (str, optional): "cvxpy" or "highs". Defaults to "cvxpy".
+        max_workers (int | None, optional): Number of processes. Defaults to the number of CPUs.
+        chunksize (int, optional): Instances sent to a worker at once. Defaults to 16.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, list[str]]: The (k, n) room of every player and the (k, n)
+            price every player pays in input order, NaN where no pricing was found, and the
+            solver status of every instance.
+    """
+    if variant not in MODES:
+        raise ValueError(f"Unknown pricing variant {variant!r}, expected one of {MODES}.")
+    rents = repeat(rent) if np.ndim(rent) == 0 else rent
+    solve = partial(_solve_instance, variant=variant, backend=backend)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(solve, valuations, rents, chunksize=chunksize))
+    num_players = len(results[0][0]) if results else 0
+    rooms = np.array([r for r, _, _ in results], dtype=int).reshape(len(results), num_players)
+    prices = np.full((len(results), num_players), np.nan)
+    for k, (_, p, _) in enumerate(results):
+        if p is not None:
+            prices[k] = p
+    return rooms, prices, [status for _, _, status in results]
@@ -0,0 +1,146 @@
+import logging
+import cvxpy as cp
+import numpy as np
+from numpy.typing import ArrayLike
+from typing import Optional
+from scipy import sparse
+from scipy.optimize import linprog
+
+# scipy's linprog status code -> the matching cvxpy status
+LINPROG_STATUS = {
+    0: cp.OPTIMAL,
+    1: cp.USER_LIMIT,
+    2: cp.INFEASIBLE,
+    3: cp.UNBOUNDED,
+    4: cp.SOLVER_ERROR,
+}
+
+# free: any prices (q6a), nonnegative: all prices >= 0 (q6b), maxmin: maximize the minimum price,
+# and only accept it if it is > 0 (q6c)
+MODES = ("free", "nonnegative", "maxmin")
+
+
+def envy_matrix(valuations: ArrayLike, rooms_allocation: dict) -> tuple[sparse.csr_array, np.ndarray]:
+    """Envy freenes of a rooms allocation as one matrix inequality, matrix @ prices <= bound.
+
+    prices[i] is the price player i pays for its room. There is a row for every ordered
+    pair of players: prices[i] - prices[j] <= v[i][x_i] - v[i][x_j].
+
+    >>> matrix, bound = envy_matrix([[150, 10], [140, 10]], {0: 0, 1: 1})
+    >>> matrix.toarray().tolist(), bound.tolist()
+    ([[1.0, -1.0], [-1.0, 1.0]], [140.0, -130.0])
+
+    Args:
+        valuations (ArrayLike): The players valuations of the rooms
+        rooms_allocation (dict): The room of every player
+
+    Returns:
+        tuple[sparse.csr_array, np.ndarray]: The sparse matrix and the bound
+    """
+    valuations = np.asarray(valuations, dtype=float)
+    num_players = len(valuations)
+    rooms = np.array([rooms_allocation[player] for player in range(num_players)])
+    # The room permutation: values[i, j] = v[i][x_j]
+    values = valuations[:, rooms]
+    i, j = np.nonzero(~np.eye(num_players, dtype=bool))
+    rows = np.repeat(np.arange(i.size), 2)
+    cols = np.column_stack([i, j]).ravel()
+    data = np.tile([1.0, -1.0], i.size)
+    matrix = sparse.csr_array((data, (rows, cols)), shape=(i.size, num_players))
+    bound = values[i, i] - values[i, j]
+    return matrix, bound
+
+
+def envy_free_prices(
+    valuations: ArrayLike,
+    rooms_allocation: dict,
+    rent: float,
+    mode: str = "free",
+    backend: str = "cvxpy",
+) -> tuple[Optional[np.ndarray], str]:
+    """Envy free prices of a rooms allocation by linear programming.
+
+    Usage example:
+    >>> v, alloc = [[150, 10], [140, 10]], {0: 0, 1: 1}
+    >>> envy_free_prices(v, alloc, 100, mode="nonnegative")
+    (None, 'infeasible')
+    >>> prices, status = envy_free_prices(v, alloc, 150, mode="maxmin", backend="highs")
+    >>> prices.tolist(), status
+    ([140.0, 10.0], 'optimal')
+
+    Args:
+        valuations (ArrayLike): The players valuations of the rooms
+        rooms_allocation (dict): The room of every player
+        rent (float): Total rent that needs to be paid
+        mode (str, optional): "free" for any prices, "nonnegative" for prices >= 0, or
+            "maxmin" to maximize the minimum price and require it to be > 0. Defaults to "free".
+        backend (str, optional): "cvxpy", or "highs" to pass the matrices directly to
+            `scipy.optimize.linprog`. Defaults to "cvxpy".
+
+    Returns:
+        tuple[Optional[np.ndarray], str]: The price every player pays, None if no pricing
+            of the mode exists, and the solver status
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown pricing mode {mode!r}, expected one of {MODES}.")
+    if backend not in ("cvxpy", "highs"):
+        raise ValueError(f"Unknown backend {backend!r}, expected 'cvxpy' or 'highs'.")
+    matrix, bound = envy_matrix(valuations, rooms_allocation)
+    num_players = matrix.shape[1]
+    if backend == "highs":
+        prices, min_price, status = _solve_highs(matrix, bound, rent, mode)
+    else:
+        prices, min_price, status = _solve_cvxpy(matrix, bound, rent, mode)
+    logging.debug("Status: %s", status)
+    if prices is None:
+        return None, status
+    if mode == "maxmin":
+        logging.debug("Z Optimal value: %s", min_price)
+        if min_price <= 0:
+            # The LP is solvable, but the best minimum price is not positive
+            return None, cp.INFEASIBLE
+    return prices[:num_players], status
+
+
+def _solve_cvxpy(matrix: sparse.csr_array, bound: np.ndarray, rent: float, mode: str) -> tuple:
+    prices = cp.Variable(matrix.shape[1])
+    constraints = [cp.sum(prices) == rent, matrix @ prices <= bound]
+    objective = cp.Maximize(0)
+    z = cp.Variable()  # minimum price
+    if mode == "nonnegative":
+        constraints.append(prices >= 0)
+    elif mode == "maxmin":
+        constraints.append(prices >= z)
+        objective = cp.Maximize(z)
+    problem = cp.Problem(objective=objective, constraints=constraints)
+    problem.solve()
+    if prices.value is None:
+        return None, None, problem.status
+    min_price = z.value.item() if mode == "maxmin" else None
+    return prices.value, min_price, problem.status
+
+
+def _solve_highs(matrix: sparse.csr_array, bound: np.ndarray, rent: float, mode: str) -> tuple:
+    num_players = matrix.shape[1]
+    a_eq = np.ones((1, num_players))
+    objective = np.zeros(num_players)
+    bounds = (0, None) if mode == "nonnegative" else (None, None)
+    if mode == "maxmin":
+        # The variables are the prices followed by z, the minimum price
+        matrix = sparse.vstack(
+            [
+                sparse.hstack([matrix, sparse.csr_array((matrix.shape[0], 1))]),
+                sparse.hstack([-sparse.eye_array(num_players), np.ones((num_players, 1))]),
+            ]
+        )
+        bound = np.concatenate([bound, np.zeros(num_players)])
+        a_eq = np.append(a_eq, 0)[None, :]
+        objective = np.append(objective, -1)  # maximize z
+    res = linprog(
+        objective, A_ub=matrix, b_ub=bound, A_eq=a_eq, b_eq=[rent], bounds=bounds, method="highs"
+    )
+    status = LINPROG_STATUS.get(res.status, cp.SOLVER_ERROR)
+    if res.status != 0:
+        return None, None, status
+    min_price = res.x[-1] if mode == "maxmin" else None
+    return res.x, min_price, status
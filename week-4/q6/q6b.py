@@ -1,7 +1,9 @@
 import logging
-import networkx as nx
-import cvxpy as cp
-from itertools import combinations
+import numpy as np
+from typing import Optional
+
+from assignment import allocate_rooms
+from pricing import envy_free_prices
 
 logging.basicConfig(level=logging.DEBUG, format="{levelname} - {message}", style="{")
 
@@ -18,26 +20,9 @@ def summary(valuations: list[list[float]], rooms_alloc: dict, pricing: dict) ->
     return "\n".join(sentences)
 
 
-def allocate_rooms(valuations: list[list[float]]) -> dict:
-    g = nx.Graph()
-    n, m = len(valuations), len(valuations[0])
-    for i in range(n):
-        for j in range(m):
-            g.add_edge(
-                f"player {i}", f"room {j}", weight=valuations[i][j], player=i, room=j
-            )
-    # Find the maximum allocation
-    allocation_edges = nx.max_weight_matching(g)
-    logging.debug("Max weighted matching: %s", allocation_edges)
-    # Extract the allocation
-    rooms_allocation = {}
-    for u, v in allocation_edges:
-        edge = g[u][v]
-        rooms_allocation[edge["player"]] = edge["room"]
-    return rooms_allocation
-
-
-def envy_free_room_allocation(valuations: list[list[float]], rent: float) -> None:
+def envy_free_room_allocation(
+    valuations: list[list[float]], rent: float, backend: str = "cvxpy"
+) -> None:
     """Allocates room to players and give prices to the rooms.
     
     Usage example:
@@ -48,35 +33,42 @@ def envy_free_room_allocation(valuations: list[list[float]], rent: float) -> Non
     >>> envy_free_room_allocation(v, r)
     Player 0 gets room 0 with value 150, and pays 130.0
     Player 1 gets room 1 with value 10, and pays -0.0
+    >>> envy_free_room_allocation(v, r, backend="highs")
+    Player 0 gets room 0 with value 150, and pays 130.0
+    Player 1 gets room 1 with value 10, and pays 0.0
 
     Args:
         valuations (list[list[float]]): The players valuations of the rooms
         rent (float): Total rent that needs to be paid
+        backend (str, optional): "cvxpy", or "highs" to pass sparse constraint matrices to
+            `scipy.optimize.linprog`. Defaults to "cvxpy".
     """
     # 1. Rooms allocation
     rooms_allocation = allocate_rooms(valuations)
     logging.debug("Allocation dictionary: %s", rooms_allocation)
 
-    # Linear programming for pricing
-    num_rooms = len(valuations[0])
-    prices = cp.Variable(num_rooms)
-    constraints = [cp.sum(prices) == rent, prices >= 0]
-    # Add envy freenes
-    num_players = len(valuations)
-    for i, j in combinations(range(num_players), 2):
-        xi, xj = rooms_allocation[i], rooms_allocation[j]
-        vi_xj, vi_xi = valuations[i][xj], valuations[i][xi]
-        vj_xi, vj_xj = valuations[j][xi], valuations[j][xj]
-        constraints.append(vi_xi - prices[i] >= vi_xj - prices[j])
-        constraints.append(vj_xj - prices[j] >= vj_xi - prices[i])
-    problem = cp.Problem(objective=cp.Maximize(0), constraints=constraints)
-    problem.solve()
-    logging.debug("Status: %s", problem.status)
-
-    if problem.status == "infeasible":
+    prices, _ = compute_prices(valuations, rent, rooms_allocation, backend)
+    if prices is None:
         print("Pricing such that all prices >= 0 doesn't exist")
     else:
-        print(summary(valuations, rooms_allocation, prices.value.tolist()))
+        print(summary(valuations, rooms_allocation, prices.tolist()))
+
+
+def compute_prices(
+    valuations: list[list[float]], rent: float, rooms_allocation: dict, backend: str = "cvxpy"
+) -> tuple[Optional[np.ndarray], str]:
+    """Envy free pricing of the given rooms allocation, see `pricing.envy_free_prices`.
+
+    Args:
+        valuations (list[list[float]]): The players valuations of the rooms
+        rent (float): Total rent that needs to be paid
+        rooms_allocation (dict): The room of every player
+        backend (str, optional): "cvxpy" or "highs". Defaults to "cvxpy".
+
+    Returns:
+        tuple[Optional[np.ndarray], str]: The price every player pays, None if no pricing with all prices >= 0 exists, and the solver status
+    """
+    return envy_free_prices(valuations, rooms_allocation, rent, mode="nonnegative", backend=backend)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+import logging
+import numpy as np
+from numpy.typing import ArrayLike
+
+from q5 import envy_free_prices, summary
+from q6.assignment import assign_rooms
+
+
+class RentDivisionSession:
+    """Rent division that is repaired incrementally when one tenant or one room changes.
+
+    The session keeps the maximum value assignment together with dual potentials of the
+    assignment LP: a value per player and a price per room, such that
+    player_value[i] + room_price[j] >= valuations[i][j], with equality on the assignment.
+    The room prices are then envy free, since no player gains from another room at its price.
+
+    The first solve uses `assign_rooms` and the heaviest envy paths of `envy_free_prices`.
+    An update unassigns a single player, restores the potentials of the changed row or
+    column, and finds one augmenting path by Dijkstra over reduced values, which takes
+    O(n^2) time instead of a full O(n^3) solve.
+
+    Usage example:
+    >>> session = RentDivisionSession([[150, 0], [140, 10]], rent=130)
+    >>> print(session.summary())
+    Player 0 gets room 0 with value 150.0, and pays 130.0
+    Player 1 gets room 1 with value 10.0, and pays 0.0
+    >>> session.update_bids(1, [170, 10])
+    >>> session.assignment.tolist()
+    [1, 0]
+    >>> print(session.summary())
+    Player 0 gets room 1 with value 0.0, and pays -10.0
+    Player 1 gets room 0 with value 170.0, and pays 140.0
+    >>> session.update_room(1, [0, 200])
+    >>> print(session.summary())
+    Player 0 gets room 0 with value 150.0, and pays 50.0
+    Player 1 gets room 1 with value 200.0, and pays 80.0
+    """
+
+    def __init__(self, valuations: ArrayLike, rent: float) -> None:
+        self.valuations = np.array(valuations, dtype=float)
+        n, m = self.valuations.shape
+        if n != m:
+            raise ValueError(f"Expected as many players as rooms, got {n} players and {m} rooms.")
+        self.rent = rent
+        self.room_of_player = assign_rooms(self.valuations)
+        self.player_of_room = np.empty(n, dtype=int)
+        self.player_of_room[self.room_of_player] = np.arange(n)
+        rooms_allocation = dict(enumerate(self.room_of_player.tolist()))
+        prices = envy_free_prices(self.valuations, rooms_allocation, rent)
+        self.room_price = np.empty(n)
+        self.room_price[self.room_of_player] = prices
+        self.player_value = self.valuations[np.arange(n), self.room_of_player] - prices
+
+    @property
+    def assignment(self) -> np.ndarray:
+        """The room of every player."""
+        return self.room_of_player.copy()
+
+    def prices(self) -> np.ndarray:
+        """The envy free price every player pays, summing up to the rent.
+
+        Returns:
+            np.ndarray: The price of the room of every player
+        """
+        n = len(self.room_price)
+        shift = (self.rent - self.room_price.sum()) / n
+        return self.room_price[self.room_of_player] + shift
+
+    def update_bids(self, player: int, values: ArrayLike) -> None:
+        """Replaces the valuations of one player for all the rooms and repairs the solution.
+
+        Args:
+            player (int): The player that changed its bids
+            values (ArrayLike): The new value of the player for every room
+        """
+        self.valuations[player] = values
+        self.player_of_room[self.room_of_player[player]] = -1
+        self.room_of_player[player] = -1
+        # The smallest value that keeps player_value + room_price >= valuations on the row
+        self.player_value[player] = (self.valuations[player] - self.room_price).max()
+        self._augment(player)
+
+    def update_room(self, room: int, values: ArrayLike) -> None:
+        """Replaces the valuations of all the players for one room and repairs the solution.
+
+        Args:
+            room (int): The room whose valuations changed
+            values (ArrayLike): The new value of every player for the room
+        """
+        self.valuations[:, room] = values
+        player = self.player_of_room[room]
+        self.room_of_player[player] = -1
+        self.player_of_room[room] = -1
+        # The smallest price that keeps player_value + room_price >= valuations on the column
+        self.room_price[room] = (self.valuations[:, room] - self.player_value).max()
+        self._augment(player)
+
+    def _augment(self, free_player: int) -> None:
+        """Assigns the free player by one shortest augmenting path, updating the potentials."""
+        n = len(self.room_price)
+        # Reduced cost of a room for the current player: potentials minus value, >= 0
+        min_slack = np.full(n, np.inf)
+        previous_room = np.full(n, -1)  # -1 stands for the free player
+        reached = np.zeros(n, dtype=bool)
+        player, last_room = free_player, -1
+        while True:
+            slack = self.player_value[player] + self.room_price - self.valuations[player]
+            improved = ~reached & (slack < min_slack)
+            min_slack[improved] = slack[improved]
+            previous_room[improved] = last_room
+            room = np.flatnonzero(~reached)[np.argmin(min_slack[~reached])]
+            delta = min_slack[room]
+            # Shift the potentials so the tree of reached rooms stays tight
+            self.player_value[free_player] -= delta
+            self.player_value[self.player_of_room[reached]] -= delta
+            self.room_price[reached] += delta
+            min_slack[~reached] -= delta
+            reached[room] = True
+            last_room = room
+            if self.player_of_room[room] == -1:
+                break
+            player = self.player_of_room[room]
+        # Flip the assignment along the path
+        while last_room != -1:
+            before = previous_room[last_room]
+            player = free_player if before == -1 else self.player_of_room[before]
+            self.player_of_room[last_room] = player
+            self.room_of_player[player] = last_room
+            last_room = before
+        logging.debug("Assignment after augmenting: %s", self.room_of_player)
+
+    def summary(self) -> str:
+        """The assignment and prices as text, like the other week-4 rent divisions."""
+        rooms_allocation = dict(enumerate(self.room_of_player.tolist()))
+        pricing = dict(enumerate(self.prices().round(2).tolist()))
+        return summary(self.valuations.tolist(), rooms_allocation, pricing)
@@ -0,0 +1,97 @@
+import logging
+from typing import Optional
+
+import numpy as np
+from numpy.typing import ArrayLike
+from scipy import sparse
+from scipy.sparse.csgraph import maximum_bipartite_matching
+
+
+def birkhoff_decomposition(
+    probabilities: ArrayLike | sparse.sparray, tol: float = 1e-9
+) -> tuple[np.ndarray, np.ndarray]:
+    """Writes a doubly stochastic matrix as a convex combination of permutation matrices.
+
+    Every round finds a perfect matching on the support of the remainder by
+    `maximum_bipartite_matching`, and subtracts it with the smallest probability on it. That
+    probability drops to zero, so there are at most n^2 rounds, and fewer for sparse lotteries.
+
+    Usage example:
+    >>> weights, permutations = birkhoff_decomposition([[0.25, 0.75], [0.75, 0.25]])
+    >>> sorted(zip(weights.tolist(), permutations.tolist()))
+    [(0.25, [0, 1]), (0.75, [1, 0])]
+    >>> weights, permutations = birkhoff_decomposition(np.full((3, 3), 1 / 3))
+    >>> len(weights), bool(np.isclose(weights.sum(), 1))
+    (3, True)
+
+    Args:
+        probabilities (ArrayLike | sparse.sparray): A doubly stochastic (n, n) matrix, such as
+            the result of `random_allocation`
+        tol (float, optional): Remaining probabilities up to tol are treated as zero.
+            Defaults to 1e-9.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The weights of the permutations, summing up to 1, and
+            a (t, n) array where permutations[s][i] is the item of agent i in permutation s.
+    """
+    remainder = sparse.csr_array(probabilities, dtype=float)
+    n, m = remainder.shape
+    if n != m:
+        raise ValueError(f"Expected a square matrix, got shape {remainder.shape}.")
+    agents = np.arange(n)
+    weights, permutations = [], []
+    while True:
+        remainder.data[remainder.data <= tol] = 0
+        remainder.eliminate_zeros()
+        if remainder.nnz == 0:
+            break
+        items = maximum_bipartite_matching(remainder, perm_type="column")
+        if (items < 0).any():
+            # Only rounding errors remain, their mass is spread by the normalization below
+            logging.debug("No perfect matching on the remainder, stopping at %s", remainder.sum())
+            break
+        weight = remainder[agents, items].min()
+        remainder = remainder - sparse.csr_array((np.full(n, weight), (agents, items)), shape=(n, n))
+        weights.append(weight)
+        permutations.append(items)
+    weights = np.array(weights)
+    return weights / weights.sum(), np.array(permutations, dtype=int).reshape(len(weights), n)
+
+
+class LotterySampler:
+    """Draws deterministic assignments from the lottery of a doubly stochastic matrix.
+
+    The Birkhoff–von Neumann decomposition is computed once, then every draw is a choice
+    of one of its permutations.
+
+    Usage example:
+    >>> sampler = LotterySampler([[0.25, 0.75], [0.75, 0.25]], seed=0)
+    >>> draws = sampler.sample(100_000)
+    >>> draws.shape
+    (100000, 2)
+    >>> bool(np.allclose((draws == 0).mean(axis=0), [0.25, 0.75], atol=0.01))
+    True
+    """
+
+    def __init__(
+        self, probabilities: ArrayLike | sparse.sparray, tol: float = 1e-9, seed: Optional[int] = None
+    ) -> None:
+        self.weights, self.permutations = birkhoff_decomposition(probabilities, tol)
+        self.rng = np.random.default_rng(seed)
+
+    def sample(self, k: int) -> np.ndarray:
+        """Draws k assignments.
+
+        Args:
+            k (int): Number of draws
+
+        Returns:
+            np.ndarray: A (k, n) array, the item of every agent in every draw
+        """
+        chosen = self.rng.choice(len(self.weights), size=k, p=self.weights)
+        return self.permutations[chosen]
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
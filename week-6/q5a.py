@@ -1,11 +1,26 @@
-from typing import Optional
+from typing import Iterable, Optional
 import cvxpy as cp
 import numpy as np
 from numpy.typing import ArrayLike
-from itertools import combinations
 from random import randint
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from scipy import sparse
+from scipy.optimize import linprog
+from scipy.sparse.csgraph import maximum_bipartite_matching
 
-def random_allocation(valuations: ArrayLike) -> np.ndarray:
+# scipy's linprog status code -> the matching cvxpy status, for every HiGHS solve of week-6
+LINPROG_STATUS = {
+    0: cp.OPTIMAL,
+    1: cp.USER_LIMIT,
+    2: cp.INFEASIBLE,
+    3: cp.UNBOUNDED,
+    4: cp.SOLVER_ERROR,
+}
+
+def random_allocation(
+    valuations: ArrayLike | sparse.sparray, backend: str = "cvxpy"
+) -> np.ndarray | sparse.csr_array:
     """Computes the probabilities of an envy free random allocation.
     
     >>> p = random_allocation([[3, 5], [5, 3]])
@@ -14,38 +29,417 @@ def random_allocation(valuations: ArrayLike) -> np.ndarray:
     >>> p = random_allocation([[8, 15], [5, 23]])
     >>> np.allclose([[0.5, 0.5], [0.5, 0.5]], p)
     True
-    
+    >>> p = random_allocation([[8, 15], [5, 23]], backend="highs")
+    >>> np.allclose([[0.5, 0.5], [0.5, 0.5]], p)
+    True
+    >>> p = random_allocation(sparse.csr_array([[3, 0], [5, 0]]))
+    >>> np.allclose([[0.5, 0.5], [0.5, 0.5]], p.toarray())
+    True
+    >>> v = [[0, 0, 6, 2, 3, 4], [0, 7, 0, 0, 7, 0], [0, 0, 2, 9, 0, 0],
+    ...      [0, 2, 2, 5, 1, 0], [4, 0, 7, 0, 0, 0], [0, 6, 7, 6, 5, 0]]
+    >>> dense = (v * random_allocation(v, backend="highs")).sum()
+    >>> sparse_welfare = (v * random_allocation(sparse.csr_array(v), backend="highs")).sum()
+    >>> round(float(dense), 6), round(float(sparse_welfare), 6)
+    (31.5, 31.5)
+    >>> round(float((v * random_allocation(sparse.csr_array(v))).sum()), 4)
+    31.5
 
     Args:
-        valuations (ArrayLike): Agents valuations of the items
+        valuations (ArrayLike): Agents valuations of the items. For a scipy.sparse array
+            the LP starts from its nonzero entries and adds the zero entries that can raise
+            the welfare, so the result has the welfare of the dense LP.
+        backend (str, optional): "cvxpy", or "highs" to skip cvxpy and pass sparse constraint
+            matrices to `scipy.optimize.linprog`. Defaults to "cvxpy".
 
     Returns:
-        np.ndarray: The probablities matrix
+        np.ndarray: The probablities matrix, a `sparse.csr_array` for sparse valuations
     """
+    probabilities, _ = _solve_random_allocation(valuations, backend)
+    return probabilities
+
+
+def _solve_random_allocation(
+    valuations: ArrayLike, backend: str = "cvxpy"
+) -> tuple[Optional[np.ndarray], str]:
+    """Solves `random_allocation` and returns the solver status as well."""
+    if backend not in ("cvxpy", "highs"):
+        raise ValueError(f"Unknown backend {backend!r}, expected 'cvxpy' or 'highs'.")
+    if sparse.issparse(valuations):
+        return _random_allocation_sparse(valuations, backend)
+    if backend == "highs":
+        return _random_allocation_highs(valuations)
     valuations = np.asarray(valuations)
 
+    n = valuations.shape[0]
     probabilities = cp.Variable(valuations.shape)
-    expected_utils = cp.multiply(valuations, probabilities).sum(axis=1)
+    # A variable for the diagonal keeps every envy row at m + 1 nonzeros instead of 2m
+    expected_utils = cp.Variable(n)
 
     constraints = [
         probabilities >= 0,
         probabilities <= 1,
         probabilities.sum(axis=1) == 1,
         probabilities.sum(axis=0) == 1,
+        expected_utils == cp.multiply(valuations, probabilities).sum(axis=1),
     ]
-    
-    for i, j in combinations(range(valuations.shape[0]), 2):
-        vi_xj = cp.multiply(probabilities[j], valuations[i]).sum()
-        vj_xi = cp.multiply(probabilities[i], valuations[j]).sum()
-        constraints.append(expected_utils[i] >= vi_xj)
-        constraints.append(expected_utils[j] >= vj_xi)
+    # utilities[i, j] is the expected value of agent i for the lottery of agent j, so envy
+    # freeness is every row bounded by its diagonal entry
+    utilities = valuations @ probabilities.T
+    own = cp.reshape(expected_utils, (n, 1), order="C")
+    constraints.append(utilities <= own @ np.ones((1, n)))
 
     objective = cp.Maximize(cp.sum(expected_utils))
     problem = cp.Problem(objective=objective, constraints=constraints)
     problem.solve()
 
-    return probabilities.value
-    
+    return probabilities.value, problem.status
+
+
+def _support_matrices(
+    valuations: sparse.csc_array, rows: np.ndarray, cols: np.ndarray
+) -> tuple[sparse.csr_array, sparse.csr_array]:
+    """Sparse matrices of the lottery LP over the probabilities of the given (agent, item) pairs.
+
+    Returns:
+        tuple[sparse.csr_array, sparse.csr_array]: The matrix that maps the probabilities
+            to the expected utilities, and the row and column sums of the probabilities.
+    """
+    n, m = valuations.shape
+    k = rows.size
+    values = valuations[rows, cols]
+    utilities_matrix = sparse.csr_array((values, (rows, np.arange(k))), shape=(n, k))
+    sums_matrix = sparse.vstack(
+        [
+            sparse.csr_array((np.ones(k), (rows, np.arange(k))), shape=(n, k)),
+            sparse.csr_array((np.ones(k), (cols, np.arange(k))), shape=(m, k)),
+        ],
+        format="csr",
+    )
+    return utilities_matrix, sums_matrix
+
+
+def envy_matrix(valuations: sparse.csc_array, rows: np.ndarray, cols: np.ndarray) -> sparse.csr_array:
+    """Envy freenes as matrix @ probabilities <= 0, one row per ordered pair of agents.
+
+    Only the agents that value the item of a pair appear in its column, so the number of
+    nonzeros grows with the nonzero valuations.
+    """
+    n = valuations.shape[0]
+    # cross[a * n + i] @ probabilities is the value agent a gives to the lottery of agent i
+    counts = np.diff(valuations.indptr)[cols]
+    pair_idx = np.repeat(np.arange(rows.size), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    entries = np.repeat(valuations.indptr[cols], counts) + offsets
+    agents = valuations.indices[entries]
+    cross = sparse.csr_array(
+        (valuations.data[entries], (agents * n + rows[pair_idx], pair_idx)), shape=(n * n, rows.size)
+    )
+    # valuations[a] @ p[i] - valuations[a] @ p[a] <= 0 for every a != i
+    a, i = np.nonzero(~np.eye(n, dtype=bool))
+    return cross[a * n + i] - cross[a * n + a]
+
+
+def lottery_lp_matrices(valuations: np.ndarray) -> tuple[sparse.csr_array, sparse.csr_array]:
+    """The matrices of the lottery LP over all the probabilities, flattened by rows.
+
+    Returns:
+        tuple[sparse.csr_array, sparse.csr_array]: The matrix that maps the probabilities
+            to the expected utilities, and the row and column sums of the probabilities.
+    """
+    n, m = valuations.shape
+    rows, cols = np.divmod(np.arange(n * m), m)
+    return _support_matrices(sparse.csc_array(valuations), rows, cols)
+
+
+def _random_allocation_highs(valuations: ArrayLike) -> tuple[Optional[np.ndarray], str]:
+    valuations = np.asarray(valuations, dtype=float)
+    n, m = valuations.shape
+    rows, cols = np.divmod(np.arange(n * m), m)
+    probabilities, status, _, _ = _lottery_highs(sparse.csc_array(valuations), rows, cols)
+    if probabilities is None:
+        return None, status
+    return probabilities.reshape(n, m), status
+
+
+# The result of a lottery LP: the probabilities of the pairs, the solver status, the
+# nonnegative duals of the envy rows with the duals of the row and column sums, as in
+# `_entering_pairs`, and the total envy left in the slacks
+_LotteryResult = tuple[Optional[np.ndarray], str, Optional[tuple[np.ndarray, np.ndarray]], float]
+
+
+def _binding_envy(
+    valuations: sparse.csc_array, rows: np.ndarray, cols: np.ndarray
+) -> tuple[sparse.csr_array, np.ndarray]:
+    """The rows of `envy_matrix` with a positive entry, and their indices.
+
+    A row without one holds for any nonnegative probabilities, and for sparse valuations
+    these are most of the n * (n - 1) rows, so the LPs leave them out and give them a
+    zero dual.
+    """
+    envy = envy_matrix(valuations, rows, cols)
+    binding = np.flatnonzero(envy.max(axis=1).toarray() > 0)
+    return envy[binding], binding
+
+
+def _lottery_highs(
+    valuations: sparse.csc_array,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    penalty: Optional[float] = None,
+) -> _LotteryResult:
+    """The envy free lottery LP over the given (agent, item) pairs, solved by HiGHS.
+
+    With a penalty, every agent gets a nonnegative slack on its envy rows that costs penalty
+    per unit of envy, so the LP is feasible on any support that holds a perfect matching.
+    """
+    n = valuations.shape[0]
+    utilities_matrix, sums_matrix = _support_matrices(valuations, rows, cols)
+    envy, binding = _binding_envy(valuations, rows, cols)
+    k, num_envy = rows.size, envy.shape[0]
+    objective = -utilities_matrix.sum(axis=0)  # maximize the sum of expected utilities
+    bounds = np.tile([0.0, 1.0], (k, 1))
+    if penalty is not None:
+        # Envy row a * (n - 1) + r is the envy of agent a, so it takes the slack of a
+        slacks = sparse.csr_array(
+            (-np.ones(num_envy), (np.arange(num_envy), binding // (n - 1))), shape=(num_envy, n)
+        )
+        envy = sparse.hstack([envy, slacks], format="csr")
+        sums_matrix = sparse.hstack([sums_matrix, sparse.csr_array((sums_matrix.shape[0], n))])
+        objective = np.concatenate([objective, np.full(n, penalty)])
+        bounds = np.vstack([bounds, np.tile([0.0, np.inf], (n, 1))])
+    res = linprog(
+        objective,
+        A_ub=envy,
+        b_ub=np.zeros(num_envy),
+        A_eq=sums_matrix,
+        b_eq=np.ones(sums_matrix.shape[0]),
+        bounds=bounds,
+        method="highs",
+    )
+    status = LINPROG_STATUS.get(res.status, cp.SOLVER_ERROR)
+    if res.status != 0:
+        return None, status, None, np.inf
+    # HiGHS minimizes minus the welfare, so its marginals are minus the duals of the maximum
+    envy_duals = np.zeros(n * (n - 1))
+    envy_duals[binding] = -res.ineqlin.marginals
+    return res.x[:k], status, (envy_duals, -res.eqlin.marginals), float(res.x[k:].sum())
+
+
+def _lottery_cvxpy(
+    valuations: sparse.csc_array,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    penalty: Optional[float] = None,
+) -> _LotteryResult:
+    """The envy free lottery LP over the given (agent, item) pairs, solved through cvxpy,
+    with penalized envy slacks as in `_lottery_highs`."""
+    n = valuations.shape[0]
+    utilities_matrix, sums_matrix = _support_matrices(valuations, rows, cols)
+    envy, binding = _binding_envy(valuations, rows, cols)
+    probabilities = cp.Variable(rows.size)
+    welfare = cp.sum(utilities_matrix @ probabilities)
+    sums = sums_matrix @ probabilities == 1
+    if penalty is None:
+        slack = None
+        envy_free = envy @ probabilities <= 0
+    else:
+        slack = cp.Variable(n, nonneg=True)
+        envy_free = envy @ probabilities <= slack[binding // (n - 1)]
+        welfare = welfare - penalty * cp.sum(slack)
+    constraints = [probabilities >= 0, probabilities <= 1, sums, envy_free]
+    problem = cp.Problem(cp.Maximize(welfare), constraints)
+    problem.solve()
+    if probabilities.value is None:
+        return None, problem.status, None, np.inf
+    envy_duals = np.zeros(n * (n - 1))
+    envy_duals[binding] = envy_free.dual_value
+    violation = 0.0 if slack is None else float(slack.value.sum())
+    return probabilities.value, problem.status, (envy_duals, sums.dual_value), violation
+
+
+def _entering_pairs(
+    valuations: sparse.csc_array,
+    envy_duals: np.ndarray,
+    sums_duals: np.ndarray,
+    support: np.ndarray,
+    threshold: float,
+    limit: Optional[int] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """The (agent, item) pairs outside the support whose probability can raise the welfare.
+
+    With the nonnegative duals y[a, i] of the envy rows, a unit of item j for agent i adds
+    valuations[a, j] to the envy row of a towards i, for every a, and takes valuations[i, j]
+    off every envy row of i, so its reduced gain is
+
+        valuations[i, j] * (1 + sum_b y[i, b]) - (y.T @ valuations)[i, j] - rows[i] - cols[j]
+
+    for the duals rows and cols of the sums. The support holds every nonzero valuation, so
+    the other pairs gain at most -rows[i] - cols[j] plus what negative valuations add. Only
+    the pairs where this bound passes the threshold are enumerated, from the items sorted by
+    their dual, and y.T @ valuations is a sparse product, so no n * m array is built.
+
+    Args:
+        valuations (sparse.csc_array): The valuations
+        envy_duals (np.ndarray): The duals of the rows of `envy_matrix`
+        sums_duals (np.ndarray): The duals of the n row sums and then the m column sums
+        support (np.ndarray): The sorted keys agent * m + item of the pairs in the LP
+        threshold (float): The least gain of an entering pair
+        limit (Optional[int], optional): The most pairs returned, those of the largest gains.
+            Defaults to all of them.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The agents and the items of the entering pairs
+    """
+    n, m = valuations.shape
+    a, i = np.nonzero(~np.eye(n, dtype=bool))
+    active = envy_duals > 0
+    duals = sparse.csr_array((envy_duals[active], (a[active], i[active])), shape=(n, n))
+    cross = sparse.csr_array(duals.T @ valuations)
+    own = duals.sum(axis=1)
+    # (y.T @ valuations)[i, j] >= -sum_a y[a, i] * negative for the largest negative valuation
+    negative = max(0.0, -valuations.data.min(initial=0))
+    slack_bound = duals.sum(axis=0) * negative
+    row_duals, col_duals = sums_duals[:n], sums_duals[n:]
+    order = np.argsort(col_duals)
+    # The items of agent i with -rows[i] - cols[j] + slack_bound[i] > threshold
+    counts = np.searchsorted(col_duals[order], slack_bound - row_duals - threshold, side="left")
+    agents = np.repeat(np.arange(n), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    items = order[offsets]
+    outside = ~np.isin(agents * m + items, support, assume_unique=False)
+    agents, items = agents[outside], items[outside]
+    if agents.size == 0:
+        return agents, items
+    values = valuations[agents, items]
+    gains = values * (1 + own[agents]) - cross[agents, items] - row_duals[agents] - col_duals[items]
+    entering = np.flatnonzero(gains > threshold)
+    if limit is not None and entering.size > limit:
+        entering = entering[np.argpartition(-gains[entering], limit)[:limit]]
+    return agents[entering], items[entering]
+
+
+# The penalty of the envy slacks grows at most tenfold this many times before the sparse
+# LP is given up as infeasible, as larger penalties only lose the precision of the solver
+MAX_PENALTY_RAISES = 8
+
+
+def _random_allocation_sparse(
+    valuations: sparse.sparray, backend: str, tol: float = 1e-7, limit: Optional[int] = None
+) -> tuple[Optional[sparse.csr_array], str]:
+    """Solves `random_allocation` starting from the probabilities of the nonzero valuations.
+
+    The support is completed to contain a perfect matching, so that a doubly stochastic
+    matrix exists over it. Envy freenes may still be infeasible on it, so the envy rows of
+    every agent get a slack with a penalty per unit of envy (phase 1). Giving an item to an
+    agent that does not value it can absorb the envy of others, so after every solve the
+    missing pairs are priced by the duals, and the best limit of those `_entering_pairs`
+    finds join the LP, until none is left (column generation). If envy is then left in the
+    slacks, the penalty grows tenfold and the pricing goes on. An optimum without envy over
+    all the pairs is the optimum of the envy free LP.
+
+    With 97% zeros, the LP keeps a small part of the pairs and has the dense welfare:
+
+    >>> rng = np.random.default_rng(0)
+    >>> v = sparse.random_array((40, 40), density=0.03, rng=rng, format="csc")
+    >>> p, status = _random_allocation_sparse(v, "highs")
+    >>> dense = random_allocation(v.toarray(), backend="highs")
+    >>> status, bool(np.isclose((v * p).sum(), (v.toarray() * dense).sum()))
+    ('optimal', True)
+
+    Args:
+        valuations (sparse.sparray): The valuations
+        backend (str): "cvxpy" or "highs", as in `random_allocation`
+        tol (float, optional): The least gain of an entering pair, relative to the largest
+            valuation, and the envy left in the slacks that counts as none. Defaults to 1e-7.
+        limit (Optional[int], optional): The most pairs that join the LP after a solve.
+            Defaults to 4 * max(n, m), which keeps the LP small when most pairs would raise
+            the welfare of the first solves.
+
+    Returns:
+        tuple[Optional[sparse.csr_array], str]: The probabilities, and the solver status
+    """
+    valuations = sparse.csc_array(valuations, dtype=float)
+    valuations.sum_duplicates()
+    valuations.eliminate_zeros()
+    n, m = valuations.shape
+    if limit is None:
+        limit = 4 * max(n, m)
+    support = sparse.coo_array(valuations)
+    rows, cols = support.row, support.col
+    # Pair every agent the matching leaves out with an item it leaves out
+    matched_item = maximum_bipartite_matching(sparse.csr_array(valuations), perm_type="column")
+    free_agents = np.flatnonzero(matched_item < 0)
+    free_items = np.setdiff1d(np.arange(m), matched_item)
+    k = min(free_agents.size, free_items.size)
+    rows = np.concatenate([rows, free_agents[:k]])
+    cols = np.concatenate([cols, free_items[:k]])
+
+    solve = _lottery_highs if backend == "highs" else _lottery_cvxpy
+    scale = max(1.0, np.abs(valuations.data).max(initial=0))
+    threshold = tol * scale
+    penalty = n * scale
+    raises = 0
+    while True:
+        probabilities, status, duals, violation = solve(valuations, rows, cols, penalty)
+        if probabilities is None:
+            return None, status
+        new_rows, new_cols = _entering_pairs(
+            valuations, *duals, np.sort(rows * m + cols), threshold, limit
+        )
+        if new_rows.size:
+            rows, cols = np.concatenate([rows, new_rows]), np.concatenate([cols, new_cols])
+        elif violation <= threshold:
+            break
+        elif raises == MAX_PENALTY_RAISES:
+            return None, cp.INFEASIBLE
+        else:
+            penalty *= 10
+            raises += 1
+    result = sparse.csr_array((probabilities, (rows, cols)), shape=(n, m))
+    result.eliminate_zeros()
+    return result, status
+
+
+def random_allocation_batch(
+    valuations: Iterable[ArrayLike],
+    backend: str = "cvxpy",
+    max_workers: Optional[int] = None,
+    chunksize: int = 16,
+) -> tuple[np.ndarray, list[str]]:
+    """Computes `random_allocation` for many instances of the same shape over a process pool.
+
+    >>> probs, statuses = random_allocation_batch(np.array([[[3, 5], [5, 3]], [[8, 15], [5, 23]]]))
+    >>> statuses
+    ['optimal', 'optimal']
+    >>> np.allclose([[[0, 1], [1, 0]], [[0.5, 0.5], [0.5, 0.5]]], probs)
+    True
+    >>> instances = [sparse.csr_array([[3, 5], [5, 3]]), sparse.csr_array([[3, 0], [5, 0]])]
+    >>> probs, _ = random_allocation_batch(instances, backend="highs", max_workers=1)
+    >>> np.allclose([[[0, 1], [1, 0]], [[0.5, 0.5], [0.5, 0.5]]], probs)
+    True
+
+    Args:
+        valuations (Iterable[ArrayLike]): A (k, n, n) array or an iterator of (n, n) valuations,
+            which may be scipy.sparse arrays
+        backend (str, optional): "cvxpy" or "highs", as in `random_allocation`. Defaults to "cvxpy".
+        max_workers (Optional[int], optional): Number of processes. Defaults to the number of CPUs.
+        chunksize (int, optional): Instances sent to a worker at once. Defaults to 16.
+
+    Returns:
+        tuple[np.ndarray, list[str]]: The (k, n, n) probabilities in input order, NaN where
+            the solve failed, and the solver status of every instance.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        solve = partial(_solve_random_allocation, backend=backend)
+        results = list(executor.map(solve, valuations, chunksize=chunksize))
+    shape = next((p.shape for p, _ in results if p is not None), (0, 0))
+    stacked = np.full((len(results), *shape), np.nan)
+    for k, (p, _) in enumerate(results):
+        if p is not None:
+            # Sparse instances give sparse probabilities, stacked densely with the others
+            stacked[k] = p.toarray() if sparse.issparse(p) else p
+    return stacked, [status for _, status in results]
+
 
 if __name__ == "__main__":
     import doctest
@@ -4,13 +4,28 @@ import numpy as np
 from numpy.typing import ArrayLike
 from random import randint
 
-from q5a import random_allocation
+from scipy.optimize import linprog
+
+from q5a import random_allocation, lottery_lp_matrices
     
-def find_pareto_dominates(valuations: ArrayLike, baseline_utils: ArrayLike) -> Optional[ArrayLike]:
+def find_pareto_dominates(
+    valuations: ArrayLike, baseline_utils: ArrayLike, backend: str = "cvxpy", tol: float = 1e-7
+) -> Optional[ArrayLike]:
     """
     For section 3 in the question. To prove that for more than 2 players the algorithm doesn't always find
     a pareto optimal random allocation.
+
+    The backend is "cvxpy", or "highs" to pass sparse constraint matrices to `scipy.optimize.linprog`.
+    A lottery dominates when it raises the welfare by more than tol * max(1, |welfare|), as in
+    `study.run_study`, so solver noise does not count.
+
+    >>> find_pareto_dominates([[3, 5], [5, 3]], [5, 5], backend="highs") is None
+    True
     """
+    if backend == "highs":
+        return _find_pareto_dominates_highs(valuations, baseline_utils, tol)
+    if backend != "cvxpy":
+        raise ValueError(f"Unknown backend {backend!r}, expected 'cvxpy' or 'highs'.")
     valuations = np.asarray(valuations)
     
     probabilities = cp.Variable(valuations.shape)
@@ -29,9 +44,28 @@ def find_pareto_dominates(valuations: ArrayLike, baseline_utils: ArrayLike) -> O
     problem.solve()    
     curr_sum = expected_utils.value.sum()
     prev_sum = np.sum(baseline_utils)
-    if curr_sum > prev_sum:
+    if curr_sum - prev_sum > tol * max(1.0, abs(prev_sum)):
         return probabilities.value
-    
+
+
+def _find_pareto_dominates_highs(
+    valuations: ArrayLike, baseline_utils: ArrayLike, tol: float
+) -> Optional[ArrayLike]:
+    valuations = np.asarray(valuations, dtype=float)
+    n, m = valuations.shape
+    utilities_matrix, sums_matrix = lottery_lp_matrices(valuations)
+    res = linprog(
+        -utilities_matrix.sum(axis=0),
+        A_ub=-utilities_matrix,  # expected_utils >= baseline_utils
+        b_ub=-np.asarray(baseline_utils, dtype=float),
+        A_eq=sums_matrix,
+        b_eq=np.ones(n + m),
+        bounds=(0, 1),
+        method="highs",
+    )
+    prev_sum = np.sum(baseline_utils)
+    if res.status == 0 and -res.fun - prev_sum > tol * max(1.0, abs(prev_sum)):
+        return res.x.reshape(n, m)
 
 
 if __name__ == "__main__":
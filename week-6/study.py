@@ -0,0 +1,205 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Optional, Sequence
+
+import cvxpy as cp
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+
+from q5a import LINPROG_STATUS, envy_matrix, lottery_lp_matrices
+
+# The values of the items are drawn uniformly from [LOW, HIGH), as in q5c
+LOW, HIGH = 1, 21
+
+# The status of an instance whose envy free LP is solved but whose dominance LP is not
+DOMINANCE_FAILED = "dominance_failed"
+
+
+def instance_valuations(seed: np.random.SeedSequence, sizes: Sequence[int]) -> np.ndarray:
+    """The valuations of one study instance, drawn only from its own seed.
+
+    >>> root = np.random.SeedSequence(7)
+    >>> instance_valuations(root.spawn(1)[0], [3]).shape
+    (3, 3)
+
+    Args:
+        seed (np.random.SeedSequence): The seed of the instance
+        sizes (Sequence[int]): The number of agents is drawn uniformly from these sizes
+
+    Returns:
+        np.ndarray: A (n, n) valuations matrix
+    """
+    rng = np.random.default_rng(seed)
+    n = rng.choice(sizes)
+    return rng.integers(size=(n, n), low=LOW, high=HIGH)
+
+
+def _solve_highs(valuations: np.ndarray) -> tuple[str, Optional[np.ndarray], Optional[np.ndarray]]:
+    n, m = valuations.shape
+    # The model of both LPs: the objective, the bounds and the doubly stochastic equalities
+    utilities_matrix, sums_matrix = lottery_lp_matrices(valuations)
+    rows, cols = np.divmod(np.arange(n * m), m)
+    model = dict(
+        c=-utilities_matrix.sum(axis=0),
+        A_eq=sums_matrix,
+        b_eq=np.ones(n + m),
+        bounds=(0, 1),
+        method="highs",
+    )
+    envy = envy_matrix(sparse.csc_array(valuations), rows, cols)
+    res = linprog(A_ub=envy, b_ub=np.zeros(envy.shape[0]), **model)
+    status = LINPROG_STATUS.get(res.status, cp.SOLVER_ERROR)
+    if res.status != 0:
+        return status, None, None
+    utilities = utilities_matrix @ res.x
+    # The same model without envy freenes, where nobody may lose
+    res = linprog(A_ub=-utilities_matrix, b_ub=-utilities, **model)
+    dominating = utilities_matrix @ res.x if res.status == 0 else None
+    return status, utilities, dominating
+
+
+def _solve_cvxpy(valuations: np.ndarray) -> tuple[str, Optional[np.ndarray], Optional[np.ndarray]]:
+    n = valuations.shape[0]
+    probabilities = cp.Variable(valuations.shape)
+    expected_utils = cp.Variable(n)
+    base_constraints = [
+        probabilities >= 0,
+        probabilities <= 1,
+        probabilities.sum(axis=1) == 1,
+        probabilities.sum(axis=0) == 1,
+        expected_utils == cp.multiply(valuations, probabilities).sum(axis=1),
+    ]
+    objective = cp.Maximize(cp.sum(expected_utils))
+    own = cp.reshape(expected_utils, (n, 1), order="C")
+    envy_free = valuations @ probabilities.T <= own @ np.ones((1, n))
+    problem = cp.Problem(objective, base_constraints + [envy_free])
+    problem.solve()
+    if expected_utils.value is None:
+        return problem.status, None, None
+    utilities = expected_utils.value.copy()
+    # The same variables and constraints, with the envy freenes replaced by nobody losing
+    dominance = cp.Problem(objective, base_constraints + [expected_utils >= utilities])
+    dominance.solve()
+    return problem.status, utilities, expected_utils.value
+
+
+def _run_instance(
+    index: int, seed: np.random.SeedSequence, sizes: Sequence[int], backend: str, tol: float
+) -> dict:
+    valuations = instance_valuations(seed, sizes)
+    solve = _solve_highs if backend == "highs" else _solve_cvxpy
+    status, utilities, dominating = solve(valuations)
+    gain, dominated = np.nan, None
+    if utilities is not None and dominating is None:
+        # The lottery is known but not whether it is dominated, so it is not counted as solved
+        status = DOMINANCE_FAILED
+    elif utilities is not None:
+        gain = dominating.sum() - utilities.sum()
+        # The lottery is not Pareto optimal if the welfare can grow without anybody losing
+        dominated = bool(gain > tol * max(1.0, abs(utilities.sum())))
+    return {
+        "instance": index,
+        "n": len(valuations),
+        "status": status,
+        "utilities": None if utilities is None else utilities.tolist(),
+        "welfare_gain": gain,
+        "dominated": dominated,
+    }
+
+
+def run_study(
+    path: str,
+    num_instances: int,
+    sizes: Sequence[int] = (3, 4, 5),
+    entropy: Optional[int] = None,
+    backend: str = "highs",
+    max_workers: Optional[int] = None,
+    chunksize: int = 16,
+    flush_every: int = 1000,
+    tol: float = 1e-7,
+) -> float:
+    """Estimates how often the envy free lottery of `random_allocation` is not Pareto optimal.
+
+    Every instance gets its own stream of `SeedSequence(entropy).spawn`, so any instance can
+    be reproduced alone by `instance_valuations`. The instances run over a process pool, and
+    each solves the envy free LP and then the dominance LP of `find_pareto_dominates` on the
+    same model. A row per instance, with its index, n, solver status, expected utilities,
+    welfare gain and whether it is dominated, is written to a parquet file every
+    flush_every instances. The root entropy is kept in the file metadata. An instance whose
+    dominance LP fails has the status DOMINANCE_FAILED and no dominated value, and is left out
+    of the fraction like the unsolved ones.
+
+    Usage example:
+    >>> import os, tempfile
+    >>> import pyarrow.parquet as pq
+    >>> path = os.path.join(tempfile.mkdtemp(), "study.parquet")
+    >>> share = run_study(path, 20, sizes=[2], entropy=1, max_workers=2, flush_every=8)
+    >>> share  # The envy free lottery of 2 agents is always Pareto optimal
+    0.0
+    >>> table = pq.read_table(path)
+    >>> table.num_rows, table.column("instance").to_pylist()[:3]
+    (20, [0, 1, 2])
+    >>> table.schema.metadata[b"entropy"]
+    b'1'
+
+    Args:
+        path (str): The parquet file to write
+        num_instances (int): Number of instances
+        sizes (Sequence[int], optional): Every instance draws its number of agents from
+            these. Defaults to (3, 4, 5).
+        entropy (Optional[int], optional): The root seed, fresh entropy if None. Defaults to None.
+        backend (str, optional): "cvxpy" or "highs". Defaults to "highs".
+        max_workers (Optional[int], optional): Number of processes. Defaults to the number of CPUs.
+        chunksize (int, optional): Instances sent to a worker at once. Defaults to 16.
+        flush_every (int, optional): Rows in every row group of the file. Defaults to 1000.
+        tol (float, optional): Relative welfare gain above which a lottery counts as
+            dominated. Defaults to 1e-7.
+
+    Returns:
+        float: The fraction of the solved instances whose envy free lottery is dominated
+    """
+    # pyarrow is only needed for the study output
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if backend not in ("cvxpy", "highs"):
+        raise ValueError(f"Unknown backend {backend!r}, expected 'cvxpy' or 'highs'.")
+    root = np.random.SeedSequence(entropy)
+    logging.info("Study entropy: %s", root.entropy)
+    schema = pa.schema(
+        [
+            ("instance", pa.int64()),
+            ("n", pa.int64()),
+            ("status", pa.string()),
+            ("utilities", pa.list_(pa.float64())),
+            ("welfare_gain", pa.float64()),
+            ("dominated", pa.bool_()),
+        ],
+        metadata={"entropy": str(root.entropy), "sizes": str(list(sizes))},
+    )
+    run = partial(_run_instance, sizes=list(sizes), backend=backend, tol=tol)
+    solved = dominated = 0
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    with executor, pq.ParquetWriter(path, schema) as writer:
+        buffer = []
+        seeds = root.spawn(num_instances)
+        results = executor.map(run, range(num_instances), seeds, chunksize=chunksize)
+        for row in results:
+            buffer.append(row)
+            if row["dominated"] is not None:
+                solved += 1
+                dominated += row["dominated"]
+            if len(buffer) == flush_every:
+                writer.write_table(pa.Table.from_pylist(buffer, schema))
+                buffer = []
+        if buffer:
+            writer.write_table(pa.Table.from_pylist(buffer, schema))
+    return dominated / solved if solved else float("nan")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    share = run_study("pareto_study.parquet", 2000)
+    print(f"The envy free lottery is not Pareto optimal in {share:.1%} of the instances")
@@ -0,0 +1,139 @@
+import csv
+import logging
+from typing import Iterable, Optional
+
+import numpy as np
+from scipy import sparse
+
+
+class ApprovalBallots:
+    """Approval ballots as a CSR incidence matrix over interned project ids.
+
+    A ballot costs 4 bytes per approved project in each direction, instead of a Python set
+    of strings per voter. `by_voter` is the (voters, projects) matrix, whose rows are the
+    approved projects, and `by_project` is its transpose, whose rows are the supporters.
+
+    Usage example:
+    >>> ballots = ApprovalBallots.from_votes([{"a", "b"}, {"b", "c"}, {"a"}])
+    >>> ballots.projects, ballots.num_voters
+    (['a', 'b', 'c'], 3)
+    >>> ballots.supporters("a").tolist(), sorted(ballots.vote(1))
+    ([0, 2], ['b', 'c'])
+    """
+
+    def __init__(
+        self,
+        projects: list[str],
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        costs: Optional[dict[str, float]] = None,
+        meta: Optional[dict[str, str]] = None,
+    ) -> None:
+        self.projects = projects
+        self.index = {project: p for p, project in enumerate(projects)}
+        data = np.ones(len(indices), dtype=np.int8)
+        # 32 bit indices unless there are too many approvals
+        dtype = np.int32 if len(indices) < np.iinfo(np.int32).max else np.int64
+        self.by_voter = sparse.csr_array(
+            (data, np.asarray(indices, dtype), np.asarray(indptr, dtype)),
+            shape=(len(indptr) - 1, len(projects)),
+        )
+        self.by_voter.sum_duplicates()
+        self.by_project = self.by_voter.T.tocsr()
+        self.costs = costs
+        self.meta = meta or {}
+
+    @classmethod
+    def from_votes(
+        cls, votes: Iterable[Iterable[str]], projects: Optional[list[str]] = None
+    ) -> "ApprovalBallots":
+        """The store of ballots given as sets of project ids.
+
+        Args:
+            votes (Iterable[Iterable[str]]): The projects every voter approves
+            projects (Optional[list[str]], optional): All the projects, including ones without
+                supporters. Defaults to the approved projects, sorted.
+
+        Returns:
+            ApprovalBallots: The ballots
+        """
+        votes = [list(vote) for vote in votes]
+        if projects is None:
+            projects = sorted({project for vote in votes for project in vote})
+        index = {project: p for p, project in enumerate(projects)}
+        indptr = np.cumsum([0] + [len(vote) for vote in votes])
+        indices = np.array([index[project] for vote in votes for project in vote], dtype=np.int32)
+        return cls(projects, indptr, indices)
+
+    @classmethod
+    def from_pb(cls, path: str, chunk_size: int = 100_000) -> "ApprovalBallots":
+        """Streams a pabulib .pb file with approval votes.
+
+        The file has META, PROJECTS and VOTES sections of ";" separated rows, each starting
+        with a header row, and the vote column holds the comma separated approved project ids.
+        The votes are read chunk_size voters at a time into integer arrays, so no per voter
+        Python objects are kept.
+
+        Args:
+            path (str): The .pb file
+            chunk_size (int, optional): Voters converted to arrays at once. Defaults to 100_000.
+
+        Returns:
+            ApprovalBallots: The ballots, with the project costs and the META section
+        """
+        meta, costs = {}, {}
+        index = {}
+        lengths, indices = [], []
+        chunk_lengths, chunk_indices = [], []
+
+        def flush() -> None:
+            lengths.append(np.array(chunk_lengths, dtype=np.int64))
+            indices.append(np.array(chunk_indices, dtype=np.int32))
+            chunk_lengths.clear()
+            chunk_indices.clear()
+
+        with open(path, newline="", encoding="utf-8") as file:
+            section, header = None, None
+            for row in csv.reader(file, delimiter=";"):
+                if len(row) == 1 and row[0].strip().upper() in ("META", "PROJECTS", "VOTES"):
+                    section, header = row[0].strip().upper(), None
+                    continue
+                if header is None:
+                    header = {name.strip(): k for k, name in enumerate(row)}
+                    continue
+                if section == "META":
+                    meta[row[0].strip()] = row[1].strip()
+                elif section == "PROJECTS":
+                    project = row[header["project_id"]].strip()
+                    index[project] = len(index)
+                    costs[project] = float(row[header["cost"]])
+                elif section == "VOTES":
+                    vote = row[header["vote"]].strip()
+                    approved = [index[project.strip()] for project in vote.split(",") if project]
+                    chunk_lengths.append(len(approved))
+                    chunk_indices.extend(approved)
+                    if len(chunk_lengths) == chunk_size:
+                        flush()
+        flush()
+        if meta.get("vote_type", "approval") != "approval":
+            logging.warning("Reading %s votes as approvals.", meta["vote_type"])
+        indptr = np.concatenate([[0], np.cumsum(np.concatenate(lengths))])
+        return cls(list(index), indptr, np.concatenate(indices), costs, meta)
+
+    @property
+    def num_voters(self) -> int:
+        return self.by_voter.shape[0]
+
+    @property
+    def num_projects(self) -> int:
+        return self.by_voter.shape[1]
+
+    def supporters(self, project: str) -> np.ndarray:
+        """The voters that approve the project."""
+        p = self.index[project]
+        return self.by_project.indices[self.by_project.indptr[p] : self.by_project.indptr[p + 1]]
+
+    def vote(self, voter: int) -> set[str]:
+        """The projects the voter approves, as in a list of sets ballot."""
+        start, end = self.by_voter.indptr[voter], self.by_voter.indptr[voter + 1]
+        return {self.projects[p] for p in self.by_voter.indices[start:end]}
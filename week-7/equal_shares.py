@@ -0,0 +1,317 @@
+import heapq
+import logging
+from typing import Optional
+
+import numpy as np
+from numpy.typing import ArrayLike
+from scipy import sparse
+
+from ballots import ApprovalBallots
+
+
+def _payment_per_supporter(supporter_balances: np.ndarray, cost: float) -> Optional[float]:
+    """The smallest rho with sum(min(balance, rho)) over the supporters equal to the cost.
+
+    The supporters whose balance is below rho pay all of it, and the rest pay rho.
+
+    >>> _payment_per_supporter(np.array([1.0, 5.0, 5.0]), 7)
+    3.0
+    >>> _payment_per_supporter(np.array([1.0, 5.0]), 7) is None
+    True
+
+    Returns:
+        Optional[float]: rho, or None if the supporters can not afford the project
+    """
+    balances = np.sort(supporter_balances)
+    count = balances.size
+    if count == 0 or balances.sum() < cost * (1 - 1e-9):
+        return None
+    # paid_before[j]: what the j poorest supporters pay, when they pay their whole balances
+    paid_before = np.concatenate([[0.0], np.cumsum(balances[:-1])])
+    # The first j where the others paying balances[j] each covers the rest of the cost
+    covered = paid_before + balances * np.arange(count, 0, -1) >= cost
+    j = np.argmax(covered) if covered.any() else count - 1
+    return max(float((cost - paid_before[j]) / (count - j)), 0.0)
+
+
+def _run_rounds(
+    approvals: sparse.csr_array,
+    by_project: sparse.csc_array,
+    costs: np.ndarray,
+    balances: np.ndarray,
+    elected: np.ndarray,
+    rounds: list[tuple[int, float, float]],
+    track: bool = False,
+) -> None:
+    """Runs equal shares rounds from the given balances until no project is affordable.
+
+    The balances and the elected projects are updated in place, and a round
+    (project, rho, margin) is appended to rounds for every winner. With track, the margin is
+    a per voter amount such that adding any smaller amount to all the balances before the
+    round keeps its winner and payment. It is 0 without track, and from the first round
+    whose margin is 0, as the rounds after it can not be reused anyway.
+    """
+    num_projects = approvals.shape[1]
+
+    def supporters(project: int) -> np.ndarray:
+        return by_project.indices[by_project.indptr[project] : by_project.indptr[project + 1]]
+
+    # Entries (rho, project), projects without supporters are never affordable
+    heap = []
+    totals = approvals.T @ balances
+    for p in np.flatnonzero(~elected & (totals >= costs * (1 - 1e-9))):
+        rho = _payment_per_supporter(balances[supporters(p)], costs[p])
+        if rho is not None:
+            heap.append((rho, p.item()))
+    heapq.heapify(heap)
+    stale = np.zeros(num_projects, dtype=bool)
+    affordable = ~elected
+    while heap:
+        rho, p = heapq.heappop(heap)
+        if not affordable[p]:
+            continue
+        if stale[p]:
+            stale[p] = False
+            rho = _payment_per_supporter(balances[supporters(p)], costs[p])
+            if rho is not None:
+                heapq.heappush(heap, (rho, p))
+            continue
+        logging.debug("Project %s is chosen with %s from each supporter.", p, rho)
+        charged = supporters(p)
+        margin = 0.0
+        if track and (balances[charged] >= rho).all():
+            margin = _round_margin(approvals, costs, balances, elected, p, rho)
+        # A run is reused only up to its first round with a zero margin
+        track = track and margin > 0
+        rounds.append((p, rho, margin))
+        elected[p] = True
+        payments = np.minimum(balances[charged], rho)
+        balances[charged] -= payments
+        affordable[p] = False
+        # Only the projects of the charged voters change their payment and total balance
+        charged_votes = approvals[charged]
+        totals -= charged_votes.T @ payments
+        touched = charged_votes.indices
+        stale[touched] = True
+        affordable[touched] &= totals[touched] >= costs[touched] * (1 - 1e-9)
+
+
+def _round_margin(
+    approvals: sparse.csr_array,
+    costs: np.ndarray,
+    balances: np.ndarray,
+    elected: np.ndarray,
+    winner: int,
+    rho: float,
+) -> float:
+    """How much can be added to every balance before a round whose winner pays rho uncapped,
+    without another project reaching a payment of rho.
+
+    Adding delta to the balances adds at most delta for each supporter below rho to
+    sum(min(balance, rho)), so a project whose cost stays above that sum still needs more.
+    """
+    reached = approvals.T @ np.minimum(balances, rho)
+    below = approvals.T @ (balances < rho).astype(float)
+    missing = costs - reached
+    others = ~elected
+    others[winner] = False
+    if (missing[others] <= 0).any():
+        # Another project pays rho as well and only loses the tie
+        return 0.0
+    with np.errstate(divide="ignore"):
+        margins = np.where(below[others] > 0, missing[others] / below[others], np.inf)
+    return margins.min(initial=np.inf)
+
+
+def equal_shares_arrays(approvals: sparse.sparray, costs: ArrayLike, budget: float) -> np.ndarray:
+    """Runs the Method of Equal Shares on a (voters, projects) approval matrix.
+
+    The balances are an array and every round is vectorized: the charges of the winner's
+    supporters, the projects they approve, which are marked stale, and the total balance of
+    the supporters of these projects, as one sparse product with the charges. The payment of
+    a project can only grow as balances shrink, so the payment in the heap is a lower bound,
+    and a stale project is recomputed only when it reaches the top.
+
+    >>> approvals = sparse.csr_array([[1, 1, 0], [0, 1, 1], [1, 0, 1], [1, 0, 0], [1, 0, 1]])
+    >>> equal_shares_arrays(approvals, [1, 1, 1], budget=2.5).tolist()
+    [0, 2]
+
+    Args:
+        approvals (sparse.sparray): Nonzero where a voter approves a project
+        costs (ArrayLike): The cost of every project
+        budget (float): The total budget
+
+    Returns:
+        np.ndarray: The indices of the chosen projects in the order they were chosen
+    """
+    approvals = sparse.csr_array(approvals, dtype=bool).astype(float)
+    num_voters, num_projects = approvals.shape
+    balances = np.full(num_voters, budget / num_voters)
+    rounds = []
+    elected = np.zeros(num_projects, dtype=bool)
+    _run_rounds(approvals, approvals.tocsc(), np.asarray(costs, dtype=float), balances, elected, rounds)
+    return np.array([p for p, _, _ in rounds], dtype=int)
+
+
+def _resume(
+    approvals: sparse.csr_array,
+    by_project: sparse.csc_array,
+    costs: np.ndarray,
+    per_voter: float,
+    reference: tuple[float, list],
+) -> tuple[tuple[float, list], int]:
+    """Runs equal shares with per_voter starting balances, reusing the rounds of a reference
+    run with smaller balances as long as their margins allow.
+
+    Returns:
+        tuple[tuple[float, list], int]: The run (per_voter, rounds) and the reused rounds
+    """
+    delta = per_voter - reference[0]
+    reused = 0
+    # The margins only hold for larger balances
+    while delta >= 0 and reused < len(reference[1]) and reference[1][reused][2] > delta:
+        reused += 1
+    balances = np.full(approvals.shape[0], per_voter)
+    elected = np.zeros(approvals.shape[1], dtype=bool)
+    rounds = []
+    for p, rho, margin in reference[1][:reused]:
+        # Uncapped rounds, every supporter paid rho
+        balances[by_project.indices[by_project.indptr[p] : by_project.indptr[p + 1]]] -= rho
+        elected[p] = True
+        rounds.append((p, rho, margin - delta))
+    _run_rounds(approvals, by_project, costs, balances, elected, rounds, track=True)
+    return (per_voter, rounds), reused
+
+
+def equal_shares_completion(
+    votes: list[set[str]] | ApprovalBallots,
+    costs: Optional[dict[str, float]] = None,
+    budget: Optional[float] = None,
+    tol: float = 1e-4,
+    max_doublings: int = 30,
+) -> dict:
+    """Equal shares with the largest virtual budget whose chosen projects fit the real budget.
+
+    The virtual budget is doubled until the outcome costs more than the budget, and then
+    found by binary search between the last fitting budget and the first that does not.
+    Every run records for each round the per voter increase of the balances that keeps it
+    unchanged, so a run with a larger virtual budget starts after the rounds of the last
+    fitting run that are still valid, instead of from scratch.
+
+    Usage example:
+    >>> votes = [{"a", "b"}, {"b", "c"}, {"a", "c"}, {"a"}, {"a", "c"}]
+    >>> result = equal_shares_completion(votes, {"a": 1, "b": 1, "c": 1}, budget=2.5)
+    >>> result["winners"], result["cost"]
+    (['a', 'c'], 2.0)
+    >>> result = equal_shares_completion(votes, {"a": 3, "b": 1, "c": 1, "d": 1}, budget=4)
+    >>> result["winners"], result["cost"], round(result["virtual_budget"], 2)
+    (['c', 'b'], 2.0, 5.21)
+
+    Args:
+        votes (list[set[str]] | ApprovalBallots): The projects every citizen approves
+        costs (Optional[dict[str, float]], optional): The cost of every project. Defaults to
+            the costs of the ballots store.
+        budget (Optional[float], optional): The total budget. Defaults to the budget in the
+            META section of the ballots store.
+        tol (float, optional): The binary search stops when the bracket is smaller than tol
+            times the budget. Defaults to 1e-4.
+        max_doublings (int, optional): Maximal number of doublings of the virtual budget.
+            Defaults to 30.
+
+    Returns:
+        dict: The winners in the order they were chosen, their cost, the virtual budget,
+            the number of runs, and the rounds computed and saved by reusing earlier runs.
+    """
+    ballots, costs, budget = _ballots_and_costs(votes, costs, budget)
+    approvals = sparse.csr_array(ballots.by_voter, dtype=bool).astype(float)
+    by_project = approvals.tocsc()
+    cost_array = np.array([costs[project] for project in ballots.projects], dtype=float)
+    num_voters = ballots.num_voters
+    stats = {"runs": 0, "rounds": 0, "rounds_saved": 0}
+
+    def run(per_voter: float, reference: tuple[float, list]) -> tuple[tuple[float, list], float]:
+        result, reused = _resume(approvals, by_project, cost_array, per_voter, reference)
+        stats["runs"] += 1
+        stats["rounds"] += len(result[1]) - reused
+        stats["rounds_saved"] += reused
+        return result, cost_array[[p for p, _, _ in result[1]]].sum()
+
+    low, low_cost = run(budget / num_voters, (budget / num_voters, []))
+    high = None
+    for _ in range(max_doublings):
+        if len(low[1]) == len(cost_array):
+            break
+        candidate, cost = run(2 * low[0], low)
+        if cost > budget:
+            high = candidate[0]
+            break
+        low, low_cost = candidate, cost
+    while high is not None and (high - low[0]) * num_voters > tol * budget:
+        candidate, cost = run((low[0] + high) / 2, low)
+        if cost > budget:
+            high = candidate[0]
+        else:
+            low, low_cost = candidate, cost
+    logging.info("Rounds computed: %s, saved: %s", stats["rounds"], stats["rounds_saved"])
+    return {
+        "winners": [ballots.projects[p] for p, _, _ in low[1]],
+        "cost": low_cost.item(),
+        "virtual_budget": low[0] * num_voters,
+        **stats,
+    }
+
+
+def _ballots_and_costs(
+    votes: list[set[str]] | ApprovalBallots, costs: Optional[dict[str, float]], budget: Optional[float]
+) -> tuple[ApprovalBallots, dict[str, float], float]:
+    if isinstance(votes, ApprovalBallots):
+        ballots = votes
+    else:
+        if costs is None:
+            raise ValueError("The costs are needed for votes given as sets.")
+        ballots = ApprovalBallots.from_votes(votes, list(costs))
+    costs = ballots.costs if costs is None else costs
+    if budget is None:
+        budget = float(ballots.meta["budget"])
+    return ballots, costs, budget
+
+
+def equal_shares(
+    votes: list[set[str]] | ApprovalBallots,
+    costs: Optional[dict[str, float]] = None,
+    budget: Optional[float] = None,
+) -> list[str]:
+    """Runs the Method of Equal Shares with approval votes until no project is affordable.
+
+    Every citizen gets an equal part of the budget. In every round the project that its
+    supporters can pay for with the smallest per supporter payment rho is chosen, and each
+    supporter pays min(balance, rho), so supporters with small balances pay all they have.
+
+    Usage example:
+    >>> votes = [{"a", "b"}, {"b", "c"}, {"a", "c"}, {"a"}, {"a", "c"}]
+    >>> equal_shares(votes, {"a": 1, "b": 1, "c": 1}, budget=2.5)
+    ['a', 'c']
+    >>> equal_shares(votes, {"a": 3, "b": 1, "c": 1, "d": 1}, budget=3)
+    ['c']
+    >>> equal_shares(ApprovalBallots.from_votes(votes), {"a": 1, "b": 1, "c": 1}, budget=2.5)
+    ['a', 'c']
+
+    Args:
+        votes (list[set[str]] | ApprovalBallots): The projects every citizen approves
+        costs (Optional[dict[str, float]], optional): The cost of every project. Defaults to
+            the costs of the ballots store, as read by `ApprovalBallots.from_pb`.
+        budget (Optional[float], optional): The total budget. Defaults to the budget in the
+            META section of the ballots store.
+
+    Returns:
+        list[str]: The chosen projects in the order they were chosen
+    """
+    ballots, costs, budget = _ballots_and_costs(votes, costs, budget)
+    projects = ballots.projects
+    winners = equal_shares_arrays(ballots.by_voter, [costs[project] for project in projects], budget)
+    return [projects[p] for p in winners]
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
@@ -1,18 +1,40 @@
+import numpy as np
+
+from ballots import ApprovalBallots
+
+
 def elect_next_budget_item(
-    votes: list[set[str]],
+    votes: list[set[str]] | ApprovalBallots,
     balances: list[float],
     costs: dict[str, float],
 ) -> None:
+    """Adds to every balance the least money that lets the supporters of an item buy it.
+
+    >>> elect_next_budget_item(ApprovalBallots.from_votes([{"a"}], ["a", "b"]), [0], {"b": 1})
+    No item can be chosen, none of them has supporters.
+    """
     amount_of_supporters = dict()
     supporters_balance = dict()
-    for voter, vote in enumerate(votes):
-        voter_balance = balances[voter]
-        for item in vote:
-            supporters_balance[item] = supporters_balance.get(item, 0) + voter_balance
-            amount_of_supporters[item] = amount_of_supporters.get(item, 0) + 1
+    if isinstance(votes, ApprovalBallots):
+        # One pass over the supporters of every project in the CSR store
+        counts = np.diff(votes.by_project.indptr)
+        totals = votes.by_project @ np.asarray(balances, dtype=float)
+        for p in np.flatnonzero(counts):
+            supporters_balance[votes.projects[p]] = totals[p].item()
+            amount_of_supporters[votes.projects[p]] = counts[p].item()
+    else:
+        for voter, vote in enumerate(votes):
+            voter_balance = balances[voter]
+            for item in vote:
+                supporters_balance[item] = supporters_balance.get(item, 0) + voter_balance
+                amount_of_supporters[item] = amount_of_supporters.get(item, 0) + 1
 
     min_cost = float("inf")
+    chosen_item = None
     for item in costs:
+        if item not in amount_of_supporters:
+            # Nobody supports the item, no amount of money makes it chosen
+            continue
         money_needed = (costs[item] - supporters_balance[item]) / amount_of_supporters[
             item
         ]
@@ -20,12 +42,20 @@ def elect_next_budget_item(
             min_cost = money_needed
             chosen_item = item
 
+    if chosen_item is None:
+        print("No item can be chosen, none of them has supporters.")
+        return
+
     print(f'After adding {min_cost} to each citizen "{chosen_item}" is chosen.')
 
     # Giving the money
+    if isinstance(votes, ApprovalBallots):
+        chosen_supporters = set(votes.supporters(chosen_item).tolist())
+    else:
+        chosen_supporters = {player for player, vote in enumerate(votes) if chosen_item in vote}
     for player in range(len(balances)):
         balances[player] += min_cost
-        if chosen_item in votes[player]:
+        if player in chosen_supporters:
             balances[player] = 0
         print(f"Citizen {player} has {balances[player]} remaining balance.")
 
@@ -42,3 +72,6 @@ if __name__ == "__main__":
     balances = [0, 0, 0, 0, 0]
     costs = {"a": 1, "b": 1, "c": 1}
     elect_next_budget_item(votes=votes, balances=balances, costs=costs)
+    # The same round on the CSR ballots store
+    balances = [0, 0, 0, 0, 0]
+    elect_next_budget_item(ApprovalBallots.from_votes(votes), balances=balances, costs=costs)
@@ -0,0 +1,148 @@
+import logging
+import os
+from typing import Callable, Iterator, Union
+
+import numpy as np
+
+from medians import MedianEngine
+
+logger = logging.Logger(__name__)
+
+
+def _chunks(votes: np.ndarray, chunk_size: int) -> Iterator[np.ndarray]:
+    for start in range(0, len(votes), chunk_size):
+        yield np.asarray(votes[start : start + chunk_size], dtype=float)
+
+
+def _phantoms_below(edges: np.ndarray, total_budget: float, n: int, t: float) -> np.ndarray:
+    """The number of phantoms c * min(1, i * t), 1 <= i < n, strictly below every edge."""
+    if t <= 0:
+        return np.where(edges > 0, n - 1, 0)
+    with np.errstate(over="ignore"):
+        count = np.ceil(edges / (total_budget * t)) - 1
+    return np.where(edges > total_budget, n - 1, np.clip(count, 0, n - 1))
+
+
+class _Histograms:
+    """Per subject vote counts in equal bins, which bracket the median of every subject."""
+
+    def __init__(self, votes: np.ndarray, total_budget: float, chunk_size: int, bins: int):
+        self.total_budget = total_budget
+        self.num_citizens, self.num_subjects = votes.shape
+        # The phantoms are in [0, c], so the medians are in [min(0, votes), max(c, votes)]
+        low, high = np.zeros(self.num_subjects), np.full(self.num_subjects, float(total_budget))
+        for chunk in _chunks(votes, chunk_size):
+            low = np.minimum(low, chunk.min(axis=0))
+            high = np.maximum(high, chunk.max(axis=0))
+        width = (high - low) / bins
+        self.edges = low[:, None] + width[:, None] * np.arange(bins + 1)
+        self.edges[:, -1] = high
+        counts = np.zeros(self.num_subjects * bins, dtype=np.int64)
+        shift = np.arange(self.num_subjects) * bins
+        for chunk in _chunks(votes, chunk_size):
+            bin_of = np.clip(((chunk - low) / width).astype(np.int64), 0, bins - 1)
+            counts += np.bincount((bin_of + shift).ravel(), minlength=counts.size)
+        # below[j, k] is the number of votes of subject j below edges[j, k]
+        below = np.cumsum(counts.reshape(self.num_subjects, bins), axis=1)
+        self.below = np.concatenate([np.zeros((self.num_subjects, 1), np.int64), below], axis=1)
+
+    def median_bins(self, t: float) -> np.ndarray:
+        """The bin k of every subject with edges[j, k] <= median <= edges[j, k + 1]."""
+        n = self.num_citizens
+        smaller = self.below + _phantoms_below(self.edges, self.total_budget, n, t)
+        # Fewer than n values are below the median, and at least n below a higher edge
+        return (smaller < n).sum(axis=1) - 1
+
+    def sum_bounds(self, t: float) -> tuple[float, float]:
+        """A lower and an upper bound of the sum of the medians."""
+        rows, bins = np.arange(self.num_subjects), self.median_bins(t)
+        return self.edges[rows, bins].sum(), self.edges[rows, bins + 1].sum()
+
+
+def _boundary(
+    predicate: Callable[[float], bool], holds_at_zero: bool, iterations: int = 64
+) -> float:
+    """The last t in [0, 1] where a monotone predicate holds, or the first if it does not
+    hold at 0, by bisection."""
+    low, high = 0.0, 1.0
+    for _ in range(iterations):
+        mid = (low + high) / 2
+        if predicate(mid) == holds_at_zero:
+            low = mid
+        else:
+            high = mid
+    return low if holds_at_zero else high
+
+
+def compute_budget_chunked(
+    total_budget: float,
+    citizen_votes: Union[np.ndarray, str, os.PathLike],
+    chunk_size: int = 100_000,
+    bins: int = 16384,
+) -> list[float]:
+    """The median rule budget of a (citizens, subjects) vote matrix that does not fit in memory.
+
+    The matrix is read chunk_size citizens at a time, from an array or a memory mapped .npy
+    file. A first pass finds the range of every subject and a second counts its votes in bins.
+    The counts below the bin edges bound the rank of every median, and so the sum of the
+    medians, which brackets the t of the solution. A third pass keeps only the votes of every
+    subject whose values the medians can take in the bracket, and the number of votes below
+    them, and `MedianEngine.from_windows` solves exactly on these. The memory is
+    O(chunk_size * m + bins * m) plus the kept votes, about n / bins per subject for spread
+    out votes, instead of the whole matrix.
+
+    Usage example:
+    >>> compute_budget_chunked(100, np.array([[100, 0, 0], [0, 0, 100]]))
+    [50.0, 0.0, 50.0]
+    >>> rng = np.random.default_rng(0)
+    >>> votes = (rng.dirichlet(np.ones(4), 10_000) * 100).astype(np.float32)
+    >>> chunked = compute_budget_chunked(100, votes, chunk_size=1024, bins=64)
+    >>> exact = MedianEngine(100, votes).budget()
+    >>> bool(np.allclose(chunked, exact, rtol=0, atol=1e-9))
+    True
+
+    Args:
+        total_budget (float): Total budget for the projects.
+        citizen_votes (Union[np.ndarray, str, os.PathLike]): The votes, or a .npy file of them
+        chunk_size (int, optional): Citizens read at once. Defaults to 100_000.
+        bins (int, optional): Bins of every subject. Defaults to 16384.
+
+    Returns:
+        list[float]: The budget to each project.
+    """
+    if isinstance(citizen_votes, (str, os.PathLike)):
+        citizen_votes = np.load(citizen_votes, mmap_mode="r")
+    votes = citizen_votes if isinstance(citizen_votes, np.ndarray) else np.asarray(citizen_votes)
+    n, m = votes.shape
+    histograms = _Histograms(votes, total_budget, chunk_size, bins)
+    # sum(medians(t)) is below the budget for t <= t_low, and above it for t >= t_high
+    t_low = _boundary(lambda t: histograms.sum_bounds(t)[1] < total_budget, True)
+    t_high = _boundary(lambda t: histograms.sum_bounds(t)[0] > total_budget, False)
+    logger.debug("t is in [%s, %s].", t_low, t_high)
+    rows = np.arange(m)
+    first, last = histograms.median_bins(t_low), histograms.median_bins(t_high) + 1
+    # The bins are found in floating point, so the windows are one bin wider on every side
+    margin = 1
+    while True:
+        low = histograms.edges[rows, np.maximum(first - margin, 0)]
+        high = histograms.edges[rows, np.minimum(last + margin, bins)]
+        below = np.zeros(m, dtype=np.int64)
+        parts = [[] for _ in range(m)]
+        for chunk in _chunks(votes, chunk_size):
+            below += (chunk < low).sum(axis=0)
+            inside = (chunk >= low) & (chunk <= high)
+            for j in range(m):
+                parts[j].append(chunk[inside[:, j], j])
+        windows = [np.concatenate(part) for part in parts]
+        logger.debug("Kept %s votes with a margin of %s bins.", sum(map(len, windows)), margin)
+        engine = MedianEngine.from_windows(total_budget, n, windows, below)
+        budget = engine.budget(bounds=(t_low, t_high))
+        if ((low <= budget) & (budget <= high)).all() or margin >= bins:
+            return budget
+        margin *= 8
+        logger.warning("A median left its window, retrying with a margin of %s bins.", margin)
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
@@ -0,0 +1,220 @@
+import numpy as np
+from numpy.typing import ArrayLike
+
+
+class MedianEngine:
+    """The medians of the citizen votes and the phantom votes of every subject, for any t.
+
+    The votes of every subject are sorted once. The n - 1 phantom votes c * min(1, i * t)
+    are increasing in i, so the median, the n-th smallest of the 2n - 1 votes, is found by a
+    binary search over the number a of citizen votes below it: the a-th smallest vote
+    comes before the (n - a + 1)-th phantom. The search runs on all the subjects at once, so
+    an evaluation takes O(m log n) time instead of sorting every subject again.
+
+    Usage example:
+    >>> engine = MedianEngine(100, [[100, 0, 0], [0, 0, 100]])
+    >>> engine.medians(0.5).tolist()
+    [50.0, 0.0, 50.0]
+    >>> engine.medians_list(0.5)
+    [50.0, 0, 50.0]
+    """
+
+    def __init__(self, total_budget: float, citizen_votes: ArrayLike) -> None:
+        self.total_budget = total_budget
+        self.citizen_votes = citizen_votes
+        votes = np.asarray(citizen_votes, dtype=float).T
+        self.order = np.argsort(votes, axis=1, kind="stable")
+        # sorted_votes[j] are the votes of subject j, from low to high
+        self.sorted_votes = np.take_along_axis(votes, self.order, axis=1)
+        self.num_subjects, self.num_citizens = self.sorted_votes.shape
+        # The number of votes of every subject below sorted_votes[j, 0]
+        self.offsets = np.zeros(self.num_subjects, dtype=int)
+
+    @classmethod
+    def from_windows(
+        cls, total_budget: float, num_citizens: int, windows: list[np.ndarray], below: ArrayLike
+    ) -> "MedianEngine":
+        """An engine that only knows the votes of every subject inside a window of values, and
+        how many votes are below the window. The medians are exact for the t values whose
+        medians fall inside the windows, and -inf or inf outside of them.
+
+        >>> engine = MedianEngine.from_windows(90, 3, [np.array([30.0]), np.array([])], [1, 1])
+        >>> engine.medians(0.5).tolist()
+        [45.0, 90.0]
+
+        Args:
+            total_budget (float): Total budget for the projects
+            num_citizens (int): The number of citizens, inside and outside the windows
+            windows (list[np.ndarray]): The votes of every subject inside its window
+            below (ArrayLike): The number of votes of every subject below its window
+
+        Returns:
+            MedianEngine: The engine, without `citizen_votes`
+        """
+        engine = cls.__new__(cls)
+        engine.total_budget = total_budget
+        engine.citizen_votes = engine.order = None
+        width = max([1] + [len(window) for window in windows])
+        # The votes above a window are inf, and the ones below it are counted by offsets
+        engine.sorted_votes = np.full((len(windows), width), np.inf)
+        for j, window in enumerate(windows):
+            engine.sorted_votes[j, : len(window)] = np.sort(window)
+        engine.offsets = np.asarray(below, dtype=int)
+        engine.num_subjects, engine.num_citizens = len(windows), num_citizens
+        return engine
+
+    def _votes(self, ranks: np.ndarray) -> np.ndarray:
+        """The ranks-th smallest vote of every subject, -inf or inf outside the windows."""
+        local = ranks - 1 - self.offsets
+        width = self.sorted_votes.shape[1]
+        votes = self.sorted_votes[np.arange(self.num_subjects), np.clip(local, 0, width - 1)]
+        return np.where(local < 0, -np.inf, np.where(local >= width, np.inf, votes))
+
+    def phantoms(self, i: np.ndarray, t: float) -> np.ndarray:
+        """The i-th phantom vote, -inf for i = 0 and inf for i >= n."""
+        values = self.total_budget * np.minimum(1, i * t)
+        return np.where(i <= 0, -np.inf, np.where(i >= self.num_citizens, np.inf, values))
+
+    def _median_ranks(self, t: float | np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """The number of citizen votes among the n smallest of every subject, and whether the
+        median is a citizen vote, with a leading axis for an array of t values."""
+        n = self.num_citizens
+        t = np.asarray(t, dtype=float)[..., None]
+        shape = t.shape[:-1] + (self.num_subjects,)
+        # Whether the a-th smallest vote comes before the (n - a + 1)-th phantom holds for
+        # a = low and not for a = high
+        low = np.ones(shape, dtype=int)
+        high = np.full(shape, n + 1)
+        while (high - low > 1).any():
+            mid = (low + high) // 2
+            # Equal phantoms come first, as in a stable sort of phantoms + votes
+            before = self._votes(mid) < self.phantoms(n - mid + 1, t)
+            low = np.where(before, mid, low)
+            high = np.where(before, high, mid)
+        from_vote = self._votes(low) >= self.phantoms(n - low, t)
+        return low, from_vote
+
+    def medians(self, t: float | np.ndarray) -> np.ndarray:
+        """The median of every subject.
+
+        Args:
+            t (float | np.ndarray): The phantoms parameter, or a (k,) array of values
+
+        Returns:
+            np.ndarray: The median of the votes and phantoms of every subject, (k, m) for
+                an array of t values
+        """
+        ranks, from_vote = self._median_ranks(t)
+        votes = self._votes(ranks)
+        phantoms = self.phantoms(self.num_citizens - ranks, np.asarray(t, dtype=float)[..., None])
+        return np.where(from_vote, votes, phantoms)
+
+    def breakpoints(self, bounds: tuple[float, float] = (0.0, 1.0)) -> np.ndarray:
+        """The values of t in bounds where a median stops being linear in t, sorted.
+
+        The median of a subject is max(v_(a), c * min(1, (n - a) * t)) for the a citizen
+        votes below it, so it bends where a phantom reaches 1, where the (n - a)-th phantom
+        crosses v_(a), or where the (n - a + 1)-th phantom does and a changes. These are
+        O(n * m) values, generated at once.
+        """
+        n = self.num_citizens
+        low, high = bounds
+        ranks = self.offsets[:, None] + np.arange(1, self.sorted_votes.shape[1] + 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # The last vote never meets an (n - a)-th phantom, and n - a = 0 gives inf or nan
+            crossings = [
+                self.sorted_votes / (self.total_budget * (n - ranks + 1)),
+                self.sorted_votes / (self.total_budget * (n - ranks)),
+            ]
+        # The phantoms that reach 1 in bounds
+        first = max(1, int(np.ceil(1 / high))) if high > 0 else n
+        last = n - 1 if low <= 0 else min(n - 1, int(1 / low))
+        capped = 1 / np.arange(first, last + 1)
+        inside = [c[(c >= low) & (c <= high)] for c in crossings]
+        candidates = [np.array([low, high]), capped[capped >= low]] + inside
+        return np.unique(np.concatenate(candidates))
+
+    def budget(self, k: int = 64, bounds: tuple[float, float] = (0.0, 1.0)) -> list:
+        """The medians whose sum is the total budget, on the exact linear segment of t.
+
+        The sum of the medians is nondecreasing in t and linear between consecutive
+        breakpoints. The search evaluates the sum at k breakpoints in one batched pass and
+        keeps the bracket between them, so it takes O(log(n * m) / log(k)) passes, and then
+        interpolates on the bracketing segment.
+
+        >>> MedianEngine(100, [[20, 30, 50], [20, 50, 30]]).budget()
+        [20, 40.0, 40.0]
+
+        Args:
+            k (int, optional): Breakpoints evaluated in every pass. Defaults to 64.
+            bounds (tuple[float, float], optional): The t values to search, which must hold the
+                solution. Defaults to (0.0, 1.0).
+
+        Returns:
+            list: The median of every subject, as in `medians_list`
+        """
+        points = self.breakpoints(bounds)
+        # Invariant: sum(medians(points[low])) <= budget < sum(medians(points[high]))
+        low, high = 0, len(points) - 1
+        low_sum = self.medians(points[low]).sum()
+        if low_sum >= self.total_budget:
+            return self.medians_list(points[low])
+        high_sum = self.medians(points[high]).sum()
+        if high_sum <= self.total_budget:
+            return self.medians_list(points[high])
+        while high - low > 1:
+            probes = np.linspace(low, high, min(k, high - low - 1) + 2).round().astype(int)
+            probes = np.unique(probes)[1:-1]
+            sums = self.medians(points[probes]).sum(axis=1)
+            below = np.flatnonzero(sums <= self.total_budget)
+            if below.size:
+                low, low_sum = probes[below[-1]], sums[below[-1]]
+            above = np.flatnonzero(sums > self.total_budget)
+            if above.size:
+                high, high_sum = probes[above[0]], sums[above[0]]
+        t_low, t_high = points[low], points[high]
+        t = t_low + (self.total_budget - low_sum) * (t_high - t_low) / (high_sum - low_sum)
+        return self.medians_list(t)
+
+    def medians_list(self, t: float) -> list:
+        """`medians` as a list, where medians that are citizen votes keep their input type,
+        like `q5a.compute_medians`."""
+        if self.citizen_votes is None:
+            return self.medians(t).tolist()
+        ranks, from_vote = self._median_ranks(t)
+        indices = self.num_citizens - ranks
+        phantoms = self.phantoms(indices, t).tolist()
+        # c * min(1, i * t) is c itself once i * t reaches 1
+        capped = (indices * t >= 1).tolist()
+        citizens = self.order[np.arange(self.num_subjects), ranks - 1].tolist()
+        return [
+            self.citizen_votes[citizens[j]][j]
+            if from_vote[j]
+            else self.total_budget if capped[j] else phantoms[j]
+            for j in range(self.num_subjects)
+        ]
+
+
+def compute_budget(total_budget: float, citizen_votes: ArrayLike) -> list[float]:
+    """Compute budget according to the medians algorithm, exactly and without bisection.
+
+    The votes are sorted in memory, `chunked.compute_budget_chunked` reads a vote matrix
+    or a .npy file in chunks instead.
+
+    Usage Example:
+    >>> compute_budget(100, [[100, 0, 0], [0, 0, 100]])
+    [50.0, 0, 50.0]
+
+    Args:
+        total_budget (float): Total budget for the projects.
+        citizen_votes (ArrayLike): Votes of each citizen how exactly should be allocated.
+
+    Returns:
+        list[float]: The budget to each project.
+    """
+    return MedianEngine(total_budget, citizen_votes).budget()
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
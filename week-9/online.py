@@ -0,0 +1,125 @@
+import logging
+from bisect import bisect_left, insort
+
+logger = logging.Logger(__name__)
+
+
+class OnlineMedianBudget:
+    """The median rule budget of votes that arrive and leave one citizen at a time.
+
+    The votes of every subject are kept in a sorted list, so adding or removing a citizen
+    is one insort or bisect per subject. The median of a subject for a given t is found by a
+    binary search over the rank of the median, as in `MedianEngine`, with O(log n) lookups in
+    the sorted list. The budget is solved by Newton steps on the sum of the medians, which is
+    linear between breakpoints, starting from the previous t and kept in a bracket where
+    bisection takes over, so every update costs at most max_iter * m * log n rank queries.
+
+    Usage example:
+    >>> online = OnlineMedianBudget(100, num_subjects=3)
+    >>> first = online.add_vote([100, 0, 0])
+    >>> second = online.add_vote([0, 0, 100])
+    >>> online.budget()
+    [50.0, 0.0, 50.0]
+    >>> third = online.add_vote([0, 100, 0])
+    >>> [round(x, 6) for x in online.budget()]
+    [33.333333, 33.333333, 33.333333]
+    >>> online.remove_vote(first)
+    >>> online.budget()
+    [0.0, 50.0, 50.0]
+    """
+
+    def __init__(self, total_budget: float, num_subjects: int, max_iter: int = 50) -> None:
+        self.total_budget = total_budget
+        self.max_iter = max_iter
+        self.sorted_votes = [[] for _ in range(num_subjects)]
+        self.citizens = {}
+        self.next_citizen = 0
+        self.t = 0.5
+
+    def add_vote(self, vote: list[float]) -> int:
+        """Adds the vote of a citizen.
+
+        Args:
+            vote (list[float]): How much the citizen gives to every subject
+
+        Returns:
+            int: The id of the citizen, for `remove_vote`
+        """
+        if len(vote) != len(self.sorted_votes):
+            raise ValueError(f"Expected {len(self.sorted_votes)} subjects, got {len(vote)}.")
+        for votes, value in zip(self.sorted_votes, vote):
+            insort(votes, value)
+        citizen = self.next_citizen
+        self.citizens[citizen] = list(vote)
+        self.next_citizen += 1
+        return citizen
+
+    def remove_vote(self, citizen: int) -> None:
+        """Removes the vote of a citizen.
+
+        Args:
+            citizen (int): The id `add_vote` returned
+        """
+        for votes, value in zip(self.sorted_votes, self.citizens.pop(citizen)):
+            del votes[bisect_left(votes, value)]
+
+    def _phantom(self, i: int, t: float) -> float:
+        return self.total_budget * min(1, i * t)
+
+    def _median(self, votes: list[float], t: float) -> tuple[float, float]:
+        """The median of the votes and phantoms of a subject, and its slope in t."""
+        n = len(votes)
+        # The a-th smallest vote comes before the (n - a + 1)-th phantom for a = low, not high
+        low, high = 1, n + 1
+        while high - low > 1:
+            mid = (low + high) // 2
+            if votes[mid - 1] < self._phantom(n - mid + 1, t):
+                low = mid
+            else:
+                high = mid
+        i = n - low
+        if i == 0 or votes[low - 1] >= self._phantom(i, t):
+            return votes[low - 1], 0.0
+        return self._phantom(i, t), 0.0 if i * t >= 1 else self.total_budget * i
+
+    def medians(self, t: float) -> tuple[list[float], float]:
+        """The median of every subject for t, and the slope in t of their sum."""
+        results = [self._median(votes, t) for votes in self.sorted_votes]
+        return [median for median, _ in results], sum(slope for _, slope in results)
+
+    def budget(self, tol: float = 1e-9) -> list[float]:
+        """Solves for the t whose medians sum up to the total budget, from the previous t.
+
+        Args:
+            tol (float, optional): Relative error of the sum of the medians. Defaults to 1e-9.
+
+        Returns:
+            list[float]: The budget of every subject
+        """
+        if not self.citizens:
+            raise ValueError("There are no votes.")
+        # Invariant: the sum at low is at most the budget, and at high at least the budget
+        low, high = 0.0, 1.0
+        t = self.t
+        for _ in range(self.max_iter):
+            medians, slope = self.medians(t)
+            error = sum(medians) - self.total_budget
+            logger.debug("t: %s, error: %s, slope: %s.", t, error, slope)
+            if abs(error) <= tol * self.total_budget:
+                break
+            if error < 0:
+                low = t
+            else:
+                high = t
+            # Exact on the current linear piece, bisection if it leaves the bracket
+            step = t - error / slope if slope > 0 else -1.0
+            t = step if low < step < high else (low + high) / 2
+        else:
+            logger.warning("The budget did not converge in %s iterations.", self.max_iter)
+        self.t = t
+        return [float(median) for median in medians]
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
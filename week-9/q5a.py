@@ -1,6 +1,8 @@
 import logging
 import math
 
+from medians import MedianEngine
+
 logger = logging.Logger(__name__)
 
 
@@ -45,13 +47,13 @@ def compute_budget(
     """
     # find t such that total allocation equals total_budget
     l, r = 0, 1
-    subjects_votes = list(map(list, zip(*citizen_votes)))
-    # More convenient matrix for the algorrithm. ordered first by subject and then by citizen.
-    logger.debug("subjects_votes: %s.", subjects_votes)
+    # The votes of every subject are sorted once for all the values of t
+    engine = MedianEngine(total_budget, citizen_votes)
+    logger.debug("sorted votes of every subject: %s.", engine.sorted_votes)
     while True:
         mid = (l + r) / 2
         logger.debug("left: %s, right: %s.", l, r)
-        medians = compute_medians(total_budget, subjects_votes, mid)
+        medians = engine.medians_list(mid)
         logger.debug("medians: %s.", medians)
         cur_budget_sum = sum(medians)
         logger.debug("current sum of medians: %s.", cur_budget_sum)
@@ -1,5 +1,5 @@
 import logging
-from q5a import compute_medians
+from medians import MedianEngine
 
 logger = logging.Logger(__name__)
 
@@ -33,6 +33,7 @@ def compute_budget(
     [20, 40.0, 40.0]
     """
     subjects_votes = list(map(list, zip(*citizen_votes)))
+    engine = MedianEngine(total_budget, citizen_votes)
     breakpoints = sorted(compute_breakpoints(total_budget, subjects_votes))
     logger.debug("Breakpoints of t: %s.", breakpoints)
     # find the lower and upper tight bount for t
@@ -43,7 +44,7 @@ def compute_budget(
         mid_idx = int((l + r) / 2)
         curr_t = breakpoints[mid_idx]
         logger.debug("checking for t=%s.", curr_t)
-        medians = compute_medians(total_budget, subjects_votes, curr_t)
+        medians = engine.medians_list(curr_t)
         logger.debug("medians of subjects votes: %s.", medians)
         total_sum = sum(medians)
         logger.debug("total sum: %s.", total_sum)
@@ -67,7 +68,7 @@ def compute_budget(
     logger.debug(
         "for t=%s, the sum of medians should be %s (total budget).", t, total_budget
     )
-    medians = compute_medians(total_budget, subjects_votes, t)
+    medians = engine.medians_list(t)
     return medians
 
 